@@ -0,0 +1,264 @@
+﻿import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bench.synthetic_vault import VaultSpec, generate_vault, section_title
+from core.fragment_cache import FragmentCache
+from core.markdown_sections import include_sections, exclude_sections, hide_headings, strip_front_matter, \
+    extract_section, extract_section_regex, replace_section_title, replace_section_title_regex
+from core.pipeline import collect_files, iter_document, render_document
+from core.rules import ExportRules, compile_rules
+from core.section_reader import read_sections
+from core.transclusion import TransclusionResolver
+from core.vault_db import VaultDatabase
+from core.vault_index import VaultIndex
+
+DEFAULT_SIZES = (1000, 10000, 50000)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+# 耗时或峰值内存超过基线的这个倍数视为退化
+DEFAULT_TOLERANCE = 1.5
+# 低于这个耗时的阶段计时噪声太大，不参与比较
+MIN_COMPARED_SECONDS = 0.05
+# 准备测试数据的阶段不属于导出流程，只显示不比较
+UNCOMPARED_STAGES = ("generate",)
+
+BENCH_RULES = ExportRules(
+    only_include=("## Summary", section_title(1), section_title(3)),
+    only_exclude=(section_title(3),),
+    hide_header=("## Summary", section_title(1)),
+)
+
+
+class StageTimer:
+    """
+    依次执行各阶段并记录耗时、峰值内存（tracemalloc）以及处理的文件数和字节数。
+    tracemalloc 会显著拖慢分配密集的代码，每个阶段先在 tracemalloc 下执行一遍只取峰值内存，
+    再单独执行一遍计时，因此 fn 必须可以重复执行且每次从相同状态开始。
+    memory=False 时只计时执行一遍（如生成仓库）。
+    """
+
+    def __init__(self):
+        self.results = {}
+
+    def run(self, name, fn, files=0, size=0, memory=True):
+        _peak = 0
+        if memory:
+            tracemalloc.start()
+            try:
+                fn()
+                _peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        _start = time.perf_counter()
+        _value = fn()
+        _seconds = time.perf_counter() - _start
+        self.results[name] = {"seconds": _seconds, "peak_bytes": _peak, "files": files, "bytes": size}
+        return _value
+
+
+def bench_size(notes, work_dir, pandoc=False, parity=False):
+    _root = os.path.join(work_dir, f"vault-{notes}")
+    timer = StageTimer()
+    _stats = timer.run("generate", lambda: generate_vault(_root, VaultSpec(notes=notes)), notes, memory=False)
+    _bytes = _stats["bytes"]
+
+    _index = timer.run("index_build", lambda: VaultIndex(_root), notes)
+    _database_path = os.path.join(work_dir, f"vault-{notes}.sqlite")
+
+    def _sync():
+        # 每一遍都从空数据库开始完整同步
+        if os.path.exists(_database_path):
+            os.remove(_database_path)
+        _database = VaultDatabase(_root, _database_path)
+        try:
+            return _database.sync()
+        finally:
+            _database.close()
+
+    timer.run("db_sync", _sync, notes, _bytes)
+    files = timer.run("collect", lambda: collect_files([_root], _index), notes)
+
+    def _read():
+        _texts = {}
+        for _file in files:
+            with open(_file, "r", encoding="utf-8") as f:
+                _texts[_file] = strip_front_matter(f.read())
+        return _texts
+
+    texts = timer.run("read", _read, len(files), _bytes)
+    _compiled = compile_rules(BENCH_RULES)
+    # 按索引中的标题偏移只读取仅包含的章节，合成笔记较小，不设大小下限
+    _database = VaultDatabase(_root, _database_path)
+    try:
+        sections = timer.run("read_sections",
+                             lambda: [read_sections(_file, _compiled.only_include, _database, min_bytes=0)
+                                      for _file in files], len(files))
+    finally:
+        _database.close()
+    timer.results["read_sections"]["bytes"] = sum(_result[1] for _result in sections if _result)
+    timer.run("include", lambda: [include_sections(_text, _compiled.only_include) for _text in texts.values()],
+              len(files), _bytes)
+    timer.run("exclude", lambda: [exclude_sections(_text, _compiled.only_exclude) for _text in texts.values()],
+              len(files), _bytes)
+    timer.run("hide", lambda: [hide_headings(_text, _compiled.hide_header) for _text in texts.values()],
+              len(files), _bytes)
+
+    def _embeds():
+        # 解析器会记住已展开的嵌入，每一遍使用新的解析器
+        _resolver = TransclusionResolver(_index)
+        for _file, _text in texts.items():
+            _resolver.expand(_text, _file)
+        return _resolver.lookups
+
+    _lookups = timer.run("embeds", _embeds, len(files), _bytes)
+    timer.results["embeds"]["lookups"] = _lookups
+    _pattern = re.compile(r"\[\[([^\[\]|]+)\|?([^\[\]]*)\]\]")
+    timer.run("wikilinks",
+              lambda: [_pattern.sub(lambda m: m.group(2) if m.group(2) else m.group(1), _text)
+                       for _text in texts.values()], len(files), _bytes)
+    texts = None
+
+    timer.run("render", lambda: render_document(files, BENCH_RULES, _index), len(files), _bytes)
+    _cache = FragmentCache(max_bytes=1 << 40)
+    render_document(files, BENCH_RULES, _index, cache=_cache)
+    timer.run("render_cached", lambda: render_document(files, BENCH_RULES, _index, cache=_cache), len(files), _bytes)
+
+    def _export_markdown():
+        # 与 core.export.stream_markdown_file 相同的流式写入，不依赖 pypandoc
+        with open(os.path.join(work_dir, f"export-{notes}.md"), "w", encoding="utf-8") as f:
+            for _chunk in iter_document(files, BENCH_RULES, _index):
+                f.write(_chunk)
+
+    timer.run("export_markdown", _export_markdown, len(files), _bytes)
+    if pandoc:
+        from core.export import export_document
+        timer.run("export_docx",
+                  lambda: export_document(files, BENCH_RULES, _index, os.path.join(work_dir, f"export-{notes}.docx")),
+                  len(files), _bytes)
+    if parity:
+        timer.results["parity"] = {"seconds": 0.0, "peak_bytes": 0, "files": len(files), "bytes": _bytes,
+                                   "mismatches": check_parity(files) +
+                                   check_section_parity(files, sections, _compiled.only_include)}
+    return timer.results
+
+
+def check_parity(files, targets=None):
+    """大纲实现与原始逐规则正则实现的结果不一致的次数"""
+    targets = targets or ("## Summary", "Summary", section_title(1), "### " + section_title(2), "# ")
+    _mismatches = 0
+    for _file in files:
+        with open(_file, "r", encoding="utf-8") as f:
+            _text = f.read()
+        for _target in targets:
+            if extract_section(_text, _target) != extract_section_regex(_text, _target):
+                _mismatches += 1
+            if replace_section_title(_text, _target, "") != replace_section_title_regex(_text, _target, ""):
+                _mismatches += 1
+    return _mismatches
+
+
+def check_section_parity(files, sections, rule_set):
+    """按章节读取与整篇读取后 include_sections 的结果不一致的次数"""
+    _mismatches = 0
+    for _file, _result in zip(files, sections):
+        if _result is None:
+            continue
+        with open(_file, "r", encoding="utf-8") as f:
+            _text = strip_front_matter(f.read())
+        _included = [_section for _section in _result[0] if _section]
+        if ("\n\n".join(_included) if _included else _text) != include_sections(_text, rule_set):
+            _mismatches += 1
+    return _mismatches
+
+
+def compare(results, baseline, tolerance):
+    """返回退化项的描述列表"""
+    regressions = []
+    for _stage, _result in results.items():
+        _base = baseline.get(_stage)
+        if _result.get("mismatches"):
+            regressions.append(f"{_stage}: {_result['mismatches']} 处结果与正则实现不一致")
+        if not _base or _stage in UNCOMPARED_STAGES:
+            continue
+        if _base["seconds"] >= MIN_COMPARED_SECONDS and _result["seconds"] > _base["seconds"] * tolerance:
+            regressions.append(f"{_stage}: 耗时 {_result['seconds']:.3f}s，基线 {_base['seconds']:.3f}s")
+        if _base["peak_bytes"] and _result["peak_bytes"] > _base["peak_bytes"] * tolerance:
+            regressions.append(f"{_stage}: 峰值内存 {_result['peak_bytes'] / 1048576:.1f} MB，"
+                               f"基线 {_base['peak_bytes'] / 1048576:.1f} MB")
+    return regressions
+
+
+def print_results(notes, results):
+    print(f"\n{notes} 篇笔记")
+    print(f"{'阶段':<16}{'耗时(s)':>10}{'文件/s':>12}{'MB/s':>10}{'峰值(MB)':>10}")
+    for _stage, _result in results.items():
+        _seconds = _result["seconds"]
+        _files_rate = _result["files"] / _seconds if _seconds and _result["files"] else 0
+        _bytes_rate = _result["bytes"] / 1048576 / _seconds if _seconds and _result["bytes"] else 0
+        _extra = ""
+        if "lookups" in _result:
+            _extra = f"  {_result['lookups']} 次嵌入查找"
+        if "mismatches" in _result:
+            _extra = f"  {_result['mismatches']} 处不一致"
+        print(f"{_stage:<16}{_seconds:>10.3f}{_files_rate:>12.0f}{_bytes_rate:>10.1f}"
+              f"{_result['peak_bytes'] / 1048576:>10.1f}{_extra}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="导出流程各阶段的基准测试，在仓库根目录以 python -m bench.run_bench 运行")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="合成仓库的笔记数")
+    parser.add_argument("--pandoc", action="store_true", help="包含 pandoc 转换 Word 的阶段")
+    parser.add_argument("--parity", action="store_true", help="校验大纲实现与正则实现的结果一致")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线文件")
+    parser.add_argument("--update-baseline", action="store_true", help="用本次结果更新基线")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="允许超过基线的倍数")
+    parser.add_argument("--work-dir", help="生成仓库的目录，缺省为临时目录并在结束后删除")
+    parser.add_argument("--json", help="将结果写入 JSON 文件")
+    args = parser.parse_args(argv)
+
+    _baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            _baselines = json.load(f)
+
+    _work_dir = args.work_dir or tempfile.mkdtemp(prefix="obsidian-exporter-bench-")
+    os.makedirs(_work_dir, exist_ok=True)
+    all_results = {}
+    regressions = []
+    try:
+        for _notes in args.sizes:
+            _results = bench_size(_notes, _work_dir, pandoc=args.pandoc, parity=args.parity)
+            all_results[str(_notes)] = _results
+            print_results(_notes, _results)
+            regressions += [f"[{_notes}] {_line}"
+                            for _line in compare(_results, _baselines.get(str(_notes), {}), args.tolerance)]
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(_work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(all_results, f, indent=2, ensure_ascii=False)
+    if args.update_baseline:
+        _baselines.update(all_results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(_baselines, f, indent=2, ensure_ascii=False, sort_keys=True)
+        print(f"\n基线已更新：{args.baseline}")
+        return 0
+    if regressions:
+        print("\n性能退化：", file=sys.stderr)
+        for _line in regressions:
+            print("  " + _line, file=sys.stderr)
+        return 1
+    print("\n未发现退化")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+﻿import argparse
+import os
+import random
+from dataclasses import dataclass
+
+_WORDS = ("vault note export heading section embed link summary detail context result method data "
+          "value index layout render preview pandoc daily project meeting review plan idea task").split()
+
+
+@dataclass(frozen=True)
+class VaultSpec:
+    """
+    合成仓库的参数。同样的参数和 seed 总是生成完全相同的仓库，基准结果才能互相比较。
+    """
+    notes: int = 1000
+    # 文件夹的层数与每层的子文件夹数
+    folder_depth: int = 2
+    folder_fanout: int = 4
+    # 每篇笔记的章节数、最大标题级别与每个章节的段落数
+    sections: int = 6
+    heading_depth: int = 3
+    paragraphs: int = 3
+    # 每个段落包含 ![[embed]] / [[link]] 的概率
+    embed_density: float = 0.05
+    link_density: float = 0.2
+    # 带有 front matter 的笔记比例
+    front_matter: float = 0.5
+    # 与其他笔记重名的比例（分布在不同文件夹）
+    duplicate_names: float = 0.02
+    # 图片等二进制附件数量
+    attachments: int = 50
+    seed: int = 0
+
+
+def _sentence(rng, words=12):
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+
+def folder_paths(spec):
+    _folders = [""]
+    _level = [""]
+    for _depth in range(spec.folder_depth):
+        _level = [os.path.join(_parent, f"folder-{_depth}-{_i}") for _parent in _level
+                  for _i in range(spec.folder_fanout)]
+        _folders.extend(_level)
+    return _folders
+
+
+def section_title(index):
+    return f"Section {index}"
+
+
+def generate_vault(root, spec):
+    """
+    在 root 下生成合成仓库，返回 {"notes", "attachments", "bytes", "embeds", "links"} 统计。
+    标题依次为 Summary 与 Section 1..n，级别在 2..heading_depth+1 之间，便于基准使用固定的标题规则。
+    """
+    rng = random.Random(spec.seed)
+    _folders = folder_paths(spec)
+    os.makedirs(os.path.join(root, ".obsidian"), exist_ok=True)
+    with open(os.path.join(root, ".obsidian", "app.json"), "w", encoding="utf-8") as f:
+        f.write("{}")
+    for _folder in _folders:
+        os.makedirs(os.path.join(root, _folder), exist_ok=True)
+
+    _names = []
+    for _i in range(spec.notes):
+        if _names and rng.random() < spec.duplicate_names:
+            _names.append(rng.choice(_names))
+        else:
+            _names.append(f"note-{_i:06d}")
+    _paths = []
+    _used = set()
+    for _i, _name in enumerate(_names):
+        _folder = rng.choice(_folders)
+        if os.path.join(_folder, _name) in _used:
+            # 重名笔记放到还没有同名文件的文件夹，都有时改用唯一的名称
+            _free = [_f for _f in _folders if os.path.join(_f, _name) not in _used]
+            if _free:
+                _folder = rng.choice(_free)
+            else:
+                _name = _names[_i] = f"note-{_i:06d}"
+        _used.add(os.path.join(_folder, _name))
+        _paths.append(os.path.join(_folder, _name + ".md"))
+
+    stats = {"notes": spec.notes, "attachments": spec.attachments, "bytes": 0, "embeds": 0, "links": 0}
+    for _path, _name in zip(_paths, _names):
+        _lines = []
+        if rng.random() < spec.front_matter:
+            _lines += ["---", f"title: {_name}", f"tags: [{rng.choice(_WORDS)}, {rng.choice(_WORDS)}]", "---", ""]
+        _lines += ["## Summary", "", _sentence(rng, 20), ""]
+        for _section in range(1, spec.sections + 1):
+            _level = rng.randint(2, spec.heading_depth + 1)
+            _lines += ["#" * _level + " " + section_title(_section), ""]
+            for _ in range(spec.paragraphs):
+                _paragraph = _sentence(rng)
+                if rng.random() < spec.link_density:
+                    _paragraph += f" See [[{rng.choice(_names)}|{rng.choice(_WORDS)}]]."
+                    stats["links"] += 1
+                _lines += [_paragraph, ""]
+                if rng.random() < spec.embed_density:
+                    _target = rng.choice(_names)
+                    _anchor = rng.choice(["", "#Summary", f"#{section_title(rng.randint(1, spec.sections))}"])
+                    _lines += [f"![[{_target}{_anchor}]]", ""]
+                    stats["embeds"] += 1
+        _data = "\n".join(_lines).encode("utf-8")
+        stats["bytes"] += len(_data)
+        with open(os.path.join(root, _path), "wb") as f:
+            f.write(_data)
+
+    for _i in range(spec.attachments):
+        _folder = os.path.join(root, rng.choice(_folders), "attachments")
+        os.makedirs(_folder, exist_ok=True)
+        with open(os.path.join(_folder, f"image-{_i:05d}.png"), "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n\0\0\0\rIHDR" + rng.randbytes(256))
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成用于基准测试的合成 Obsidian 仓库")
+    parser.add_argument("root", help="输出目录")
+    parser.add_argument("--notes", type=int, default=VaultSpec.notes)
+    parser.add_argument("--sections", type=int, default=VaultSpec.sections)
+    parser.add_argument("--heading-depth", type=int, default=VaultSpec.heading_depth)
+    parser.add_argument("--embed-density", type=float, default=VaultSpec.embed_density)
+    parser.add_argument("--front-matter", type=float, default=VaultSpec.front_matter)
+    parser.add_argument("--attachments", type=int, default=VaultSpec.attachments)
+    parser.add_argument("--seed", type=int, default=VaultSpec.seed)
+    args = parser.parse_args(argv)
+    stats = generate_vault(args.root, VaultSpec(
+        notes=args.notes, sections=args.sections, heading_depth=args.heading_depth,
+        embed_density=args.embed_density, front_matter=args.front_matter, attachments=args.attachments,
+        seed=args.seed))
+    print(f"生成 {stats['notes']} 篇笔记、{stats['attachments']} 个附件，共 {stats['bytes'] / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
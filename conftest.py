@@ -0,0 +1 @@
+﻿# 让直接在仓库根目录运行 pytest 时可以导入 core、bench 等包
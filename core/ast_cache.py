@@ -0,0 +1,126 @@
+﻿import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from core.vault_db import user_cache_dir
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# 最近这段时间内用过的条目不清理：其他进程（如批量导出的进程池）可能正在从它转换，
+# 而 _in_use 只记录本进程的使用情况
+PRUNE_GRACE_SECONDS = 15 * 60
+
+
+class AstCache:
+    """
+    pandoc JSON AST 的磁盘缓存，同一份 Markdown 只解析一次，之后每种输出格式都从 AST 转换。
+
+    键为 Markdown 内容与 pandoc 可执行文件（路径、mtime）的哈希，pandoc 升级后旧的 AST 自然失效；
+    总大小超过上限时按最近使用时间删除最旧的条目。
+
+    get() / put() 返回的 AST 在 release() 之前不会被清理，即使它本身超过上限，
+    也不会被另一次导出（同一进程中的其他实例）在转换途中删除。
+    其他进程无法看到本进程的引用，因此 PRUNE_GRACE_SECONDS 内被 get() / put() 过的条目也一律保留，
+    总大小可能暂时超过上限。
+    """
+    # 同一进程内的所有实例共用：锁与正在使用的 AST（路径 -> 引用数）
+    _lock = threading.Lock()
+    _in_use = {}
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or os.path.join(user_cache_dir(), "ast")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(markdown_digest, pandoc_path):
+        """markdown_digest 为 Markdown 内容的 sha1 十六进制摘要"""
+        try:
+            _pandoc = f"{pandoc_path}:{os.stat(pandoc_path).st_mtime_ns}"
+        except (OSError, TypeError):
+            _pandoc = str(pandoc_path)
+        return hashlib.sha1(f"{markdown_digest}\0{_pandoc}".encode("utf-8")).hexdigest()
+
+    def path_for(self, key):
+        return os.path.normpath(os.path.join(self.cache_dir, key + ".json"))
+
+    def get(self, key):
+        """命中时返回 AST 文件路径并刷新其使用时间，否则返回 None；用完后需调用 release()"""
+        _path = self.path_for(key)
+        with self._lock:
+            try:
+                os.utime(_path)
+            except OSError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._in_use[_path] = self._in_use.get(_path, 0) + 1
+            return _path
+
+    def temp_path(self):
+        # 与缓存同目录的临时文件，写完后 os.replace 原子地放入缓存
+        _fd, _path = tempfile.mkstemp(suffix=".tmp", dir=self.cache_dir)
+        os.close(_fd)
+        return _path
+
+    def put(self, key, ast_path):
+        """将写好的 AST 文件移入缓存，返回缓存中的路径；用完后需调用 release()"""
+        _path = self.path_for(key)
+        with self._lock:
+            os.replace(ast_path, _path)
+            self._in_use[_path] = self._in_use.get(_path, 0) + 1
+            self._prune()
+        return _path
+
+    def release(self, path):
+        """get() / put() 返回的 AST 不再使用，之后可以被清理"""
+        with self._lock:
+            _count = self._in_use.get(path, 0) - 1
+            if _count > 0:
+                self._in_use[path] = _count
+            else:
+                self._in_use.pop(path, None)
+
+    def clear(self):
+        with self._lock:
+            for _entry in self._entries():
+                _remove(_entry.path)
+
+    def stats(self):
+        _entries = self._entries()
+        return {
+            "entries": len(_entries),
+            "size_bytes": sum(_entry.stat().st_size for _entry in _entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _entries(self):
+        try:
+            with os.scandir(self.cache_dir) as _it:
+                return [_entry for _entry in _it if _entry.name.endswith(".json")]
+        except OSError:
+            return []
+
+    def _prune(self):
+        _entries = sorted(self._entries(), key=lambda _entry: _entry.stat().st_mtime_ns)
+        _size = sum(_entry.stat().st_size for _entry in _entries)
+        # 正在使用的条目（包括刚放入的）与最近用过的条目计入总大小但不删除
+        _cutoff = time.time_ns() - PRUNE_GRACE_SECONDS * 1_000_000_000
+        _entries = [_entry for _entry in _entries
+                    if _entry.stat().st_mtime_ns < _cutoff and os.path.normpath(_entry.path) not in self._in_use]
+        while _entries and _size > self.max_bytes:
+            _entry = _entries.pop(0)
+            _size -= _entry.stat().st_size
+            _remove(_entry.path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
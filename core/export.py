@@ -0,0 +1,392 @@
+﻿import hashlib
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+import pypandoc
+
+from core.ast_cache import AstCache
+from core.pipeline import collect_files, iter_document, FILE_SEPARATOR
+from core.profiling import NULL_PROFILE
+from core.rules import ExportRules
+from core.selection import SelectionFilter
+from core.vault_index import VaultIndex
+
+if hasattr(sys, '_MEIPASS'):
+    # PyInstaller 在打包后，_MEIPASS 指向临时解压/运行目录
+    base_path = sys._MEIPASS
+    pandoc_path = os.path.join(base_path, 'pandoc/pandoc')
+    pypandoc.__pandoc_path = pandoc_path
+
+# 扩展名 -> pandoc 输出格式，未列出的扩展名直接作为格式名交给 pandoc
+PANDOC_FORMATS = {
+    ".docx": "docx",
+    ".odt": "odt",
+    ".html": "html",
+    ".htm": "html",
+    ".pdf": "pdf",
+    ".txt": "plain",
+}
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+# 支持 --reference-doc 模板的输出格式
+REFERENCE_DOC_FORMATS = ("docx", "odt", "pptx")
+# 默认只输出片段、需要 --standalone 才生成完整文档（含 <head> 与字符集声明）的输出格式，docx/odt 本身总是完整文档
+STANDALONE_FORMATS = ("html", "html4", "html5", "latex", "rtf")
+# 批量导出的拆分方式：每个笔记一个文件 / 每个顶层文件夹一个文件
+BATCH_BY_NOTE = "note"
+BATCH_BY_FOLDER = "folder"
+# 进程池上限，pandoc 本身也是独立进程，过多的并行只会争抢 CPU 与磁盘
+MAX_EXPORT_WORKERS = 8
+
+
+_pandoc_path = None
+
+
+def get_pandoc_path():
+    """查找（必要时下载）pandoc，结果在进程内缓存，批量导出时不再每个任务查找一次"""
+    global _pandoc_path
+    if _pandoc_path is None:
+        _path = pypandoc.get_pandoc_path()
+        if _path is None:
+            pypandoc.download_pandoc()
+            _path = pypandoc.get_pandoc_path()
+        _pandoc_path = _path
+    return _pandoc_path
+
+
+def _init_export_worker(pandoc_path, vault_snapshots):
+    # 进程池子进程沿用主进程已找到的 pandoc 路径，并由主进程的索引快照恢复仓库索引，不再各自遍历仓库
+    global _pandoc_path
+    _pandoc_path = pandoc_path
+    for _vault, (_files, _dir_mtimes) in vault_snapshots.items():
+        _index = VaultIndex()
+        _index.load(_vault, _files, _dir_mtimes)
+        _vault_indexes[_vault] = _index
+
+
+def is_markdown_output(output_path):
+    return os.path.splitext(output_path)[1].lower() in MARKDOWN_EXTENSIONS
+
+
+def pandoc_format_for(output_path):
+    _ext = os.path.splitext(output_path)[1].lower()
+    return PANDOC_FORMATS.get(_ext, _ext.lstrip("."))
+
+
+def _temp_output_path(output_path):
+    # 临时文件放在目标目录中，保证 os.replace 不跨文件系统；保留扩展名以便 pandoc 按格式输出
+    _directory, _name = os.path.split(os.path.abspath(output_path))
+    _fd, _path = tempfile.mkstemp(prefix=f".{_name}.", suffix=os.path.splitext(_name)[1], dir=_directory)
+    os.close(_fd)
+    return _path
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def stream_markdown_file(chunks, output_path, profile=NULL_PROFILE):
+    # 逐块写入，不在内存中拼接整篇文档
+    with open(output_path, "w", encoding="utf-8") as f:
+        for _chunk in chunks:
+            with profile.stage("write", size=len(_chunk)):
+                f.write(_chunk)
+    return True
+
+
+def _pandoc_command(from_format, to_format, output_path, reference_doc=None):
+    _command = [get_pandoc_path(), "--from", from_format, "--to", to_format, "--output", output_path]
+    if to_format in STANDALONE_FORMATS:
+        _command.append("--standalone")
+    if reference_doc and to_format in REFERENCE_DOC_FORMATS:
+        _command.append(f"--reference-doc={reference_doc}")
+    return _command
+
+
+def stream_to_pandoc(chunks, output_path, to_format, reference_doc=None, profile=NULL_PROFILE):
+    """
+    将 Markdown 逐块写入 pandoc 的标准输入并由 pandoc 直接生成输出文件。
+    reference_doc 为 Word/ODT 的样式模板，其他格式忽略。
+    """
+    _process = subprocess.Popen(_pandoc_command("markdown", to_format, output_path, reference_doc),
+                                stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        for _chunk in chunks:
+            _data = _chunk.encode("utf-8")
+            # pandoc 读得慢时写入会阻塞，这部分时间也计入写入
+            with profile.stage("write", size=len(_data)):
+                _process.stdin.write(_data)
+        _process.stdin.close()
+    except BrokenPipeError:
+        # pandoc 提前退出，错误信息在 stderr 中
+        pass
+    except BaseException:
+        _process.kill()
+        _process.wait()
+        raise
+    with profile.stage("pandoc", detail=output_path):
+        _stderr = _process.stderr.read()
+        _returncode = _process.wait()
+    if _returncode != 0:
+        raise RuntimeError(f"pandoc 转换失败：{_stderr.decode('utf-8', errors='replace').strip()}")
+    return True
+
+
+def iter_export_chunks(files, rules, vault_index, output_path, cache=None, on_progress=None, is_cancelled=None,
+                       profile=NULL_PROFILE):
+    """
+    生成导出用的文档片段。转换为 Word 等格式时不输出开头的空元数据块和文件间分隔线，
+    与原先经预览转换后删除 "- - -" 得到的结果一致。
+    """
+    if is_markdown_output(output_path):
+        yield from iter_document(files, rules, vault_index, is_cancelled, on_progress, cache, profile=profile)
+        return
+    for _chunk in iter_document(files, rules, vault_index, is_cancelled, on_progress, cache, head=False,
+                                profile=profile):
+        yield _chunk[:-len(FILE_SEPARATOR)] if not rules.hide_separator and _chunk.endswith(FILE_SEPARATOR) \
+            else _chunk
+
+
+def export_document(files, rules, vault_index, output_path, cache=None, on_progress=None, is_cancelled=None,
+                    reference_doc=None, profile=NULL_PROFILE):
+    """
+    流式导出：片段逐个写入输出文件或 pandoc，峰值内存与选择的总大小无关。
+    先写入目标目录中的临时文件，完成后才替换 output_path；取消或出错时删除临时文件，
+    不会留下截断的输出。取消时返回 False。
+    """
+    _chunks = iter_export_chunks(files, rules, vault_index, output_path, cache, on_progress, is_cancelled, profile)
+    _temp_path = _temp_output_path(output_path)
+    try:
+        if is_markdown_output(output_path):
+            stream_markdown_file(_chunks, _temp_path, profile)
+        else:
+            stream_to_pandoc(_chunks, _temp_path, pandoc_format_for(output_path), reference_doc, profile)
+        if is_cancelled is not None and is_cancelled():
+            _remove_quietly(_temp_path)
+            return False
+        os.replace(_temp_path, output_path)
+    except BaseException:
+        _remove_quietly(_temp_path)
+        raise
+    return True
+
+
+def _run_pandoc(command):
+    _process = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if _process.returncode != 0:
+        raise RuntimeError(f"pandoc 转换失败：{_process.stderr.decode('utf-8', errors='replace').strip()}")
+
+
+def parse_to_ast(files, rules, vault_index, ast_cache=None, cache=None, on_progress=None, is_cancelled=None,
+                 profile=NULL_PROFILE):
+    """
+    将文档解析为 pandoc JSON AST 并返回其路径。Markdown 先流式写入临时文件并同时计算哈希，
+    内容与缓存中的某个 AST 相同时直接复用，不再调用 pandoc 解析。取消时返回 None。
+    返回的 AST 在 ast_cache.release() 之前不会被缓存清理。
+    """
+    ast_cache = ast_cache or AstCache()
+    _markdown_path = ast_cache.temp_path()
+    try:
+        _hash = hashlib.sha1()
+        with open(_markdown_path, "wb") as f:
+            # 与转换为 Word 等格式时的片段一致：没有开头的元数据块和文件间分隔线
+            for _chunk in iter_export_chunks(files, rules, vault_index, "", cache, on_progress, is_cancelled,
+                                             profile):
+                _data = _chunk.encode("utf-8")
+                with profile.stage("write", size=len(_data)):
+                    _hash.update(_data)
+                    f.write(_data)
+        if is_cancelled is not None and is_cancelled():
+            return None
+        _key = AstCache.make_key(_hash.hexdigest(), get_pandoc_path())
+        _ast_path = ast_cache.get(_key)
+        if _ast_path is not None:
+            profile.count("ast_cache_hits")
+            return _ast_path
+        _temp_ast_path = ast_cache.temp_path()
+        try:
+            with profile.stage("parse_ast"):
+                _run_pandoc(_pandoc_command("markdown", "json", _temp_ast_path) + [_markdown_path])
+        except BaseException:
+            os.remove(_temp_ast_path)
+            raise
+        return ast_cache.put(_key, _temp_ast_path)
+    finally:
+        os.remove(_markdown_path)
+
+
+def convert_ast(ast_path, output_path, reference_doc=None, profile=NULL_PROFILE):
+    # Markdown 输出也由 AST 生成（pandoc 的 markdown 写出器），与其他格式内容一致
+    _format = "markdown" if is_markdown_output(output_path) else pandoc_format_for(output_path)
+    _temp_path = _temp_output_path(output_path)
+    try:
+        with profile.stage("convert", detail=output_path):
+            _run_pandoc(_pandoc_command("json", _format, _temp_path, reference_doc) + [ast_path])
+        os.replace(_temp_path, output_path)
+    except BaseException:
+        _remove_quietly(_temp_path)
+        raise
+    return output_path
+
+
+def export_formats(files, rules, vault_index, output_paths, reference_doc=None, ast_cache=None, cache=None,
+                   on_progress=None, is_cancelled=None, profile=NULL_PROFILE):
+    """
+    一次导出多种格式（如 .docx、.html、.odt、.md）：文档只解析一次为 AST，
+    各格式由独立的 pandoc 进程并行从 AST 转换。返回是否完成（取消时为 False）。
+    """
+    ast_cache = ast_cache or AstCache()
+    _ast_path = parse_to_ast(files, rules, vault_index, ast_cache, cache, on_progress, is_cancelled, profile)
+    if _ast_path is None:
+        return False
+    try:
+        with ThreadPoolExecutor(max_workers=len(output_paths) or 1) as executor:
+            for _future in [executor.submit(convert_ast, _ast_path, _path, reference_doc, profile)
+                            for _path in output_paths]:
+                _future.result()
+    finally:
+        ast_cache.release(_ast_path)
+    return True
+
+
+@dataclass(frozen=True)
+class ExportJob:
+    """一次导出：仓库根目录、相对仓库的选择、规则、文件过滤条件与输出文件"""
+    vault: str
+    select: tuple
+    output: str
+    rules: ExportRules = field(default_factory=ExportRules)
+    selection_filter: SelectionFilter = field(default_factory=SelectionFilter)
+    # 同一文档的其他输出文件，与 output 共用一次解析
+    extra_outputs: tuple = ()
+    reference_doc: str = None
+
+    def outputs(self):
+        return (self.output,) + tuple(self.extra_outputs)
+
+    def selected_paths(self):
+        return [os.path.join(self.vault, _path) for _path in self.select] if self.select else [self.vault]
+
+
+# 每个进程内按仓库根目录复用索引，同一仓库的多个任务只扫描一次
+_vault_indexes = {}
+
+
+def _vault_key(vault):
+    return os.path.normpath(os.path.abspath(vault))
+
+
+def _vault_index_for(vault):
+    _key = _vault_key(vault)
+    _index = _vault_indexes.get(_key)
+    if _index is None:
+        _index = _vault_indexes[_key] = VaultIndex(vault)
+    else:
+        _index.refresh()
+    return _index
+
+
+def run_job(job, vault_index=None):
+    # 选择中有不存在的路径（拼写错误、清单过期）或展开后没有笔记时报错，而不是导出一个空文档
+    _paths = job.selected_paths()
+    _missing = [_path for _path in _paths if not os.path.exists(_path)]
+    if _missing:
+        raise FileNotFoundError(f"选择的路径不存在：{', '.join(_missing)}")
+    _vault_index = vault_index if vault_index is not None else _vault_index_for(job.vault)
+    files = collect_files(_paths, _vault_index, job.selection_filter)
+    if not files:
+        raise RuntimeError(f"选择中没有可导出的笔记：{', '.join(_paths)}")
+    for _output in job.outputs():
+        os.makedirs(os.path.dirname(os.path.abspath(_output)), exist_ok=True)
+    if job.extra_outputs:
+        export_formats(files, job.rules, _vault_index, job.outputs(), job.reference_doc)
+    else:
+        export_document(files, job.rules, _vault_index, job.output, reference_doc=job.reference_doc)
+    return ", ".join(job.outputs()), len(files)
+
+
+def split_batch_jobs(files, vault, output_dir, mode=BATCH_BY_NOTE, rules=None, extension=".docx",
+                     reference_doc=None):
+    """
+    将已展开的文件列表拆分为批量导出任务：BATCH_BY_NOTE 每个笔记一个输出文件（保持相对仓库的目录结构，避免重名），
+    BATCH_BY_FOLDER 按仓库下的顶层文件夹合并为一个输出文件，仓库根目录下的笔记合并到以仓库命名的文件中。
+    """
+    rules = rules or ExportRules()
+    vault = os.path.normpath(os.path.abspath(vault))
+    _groups = {}
+    for _file in files:
+        _relative = os.path.relpath(_file, vault)
+        if mode == BATCH_BY_NOTE:
+            _name = os.path.splitext(_relative)[0]
+        elif os.sep in _relative:
+            _name = _relative.split(os.sep, 1)[0]
+        else:
+            _name = os.path.basename(vault)
+        _groups.setdefault(_name, []).append(_relative)
+    return [ExportJob(vault=vault, select=tuple(_select), output=os.path.join(output_dir, _name + extension),
+                      rules=rules, reference_doc=reference_doc)
+            for _name, _select in _groups.items()]
+
+
+def run_jobs(jobs, max_workers=None, on_result=None, is_cancelled=None, vault_index=None):
+    """
+    在进程池中并行执行导出任务，返回 [(job, 结果或异常)]，顺序与 jobs 一致。
+    on_result(job, result, error) 在每个任务完成时回调；is_cancelled() 返回 True 时不再启动新任务，
+    已在执行的任务会完成，未执行的任务结果为 None。
+    vault_index 为调用方已建立的仓库索引（如界面中的索引），对应仓库的任务直接使用它，不再重新扫描。
+    """
+    jobs = list(jobs)
+    results = [(_job, None) for _job in jobs]
+    max_workers = max_workers or min(MAX_EXPORT_WORKERS, os.cpu_count() or 1)
+
+    def _finish(_i, _result, _error):
+        results[_i] = (jobs[_i], _error if _error is not None else _result)
+        if on_result is not None:
+            on_result(jobs[_i], _result, _error)
+
+    def _index_for(_vault):
+        if vault_index is not None and _vault_key(vault_index.root_path) == _vault_key(_vault):
+            return vault_index
+        return _vault_index_for(_vault)
+
+    if max_workers == 1 or len(jobs) <= 1:
+        for _i, _job in enumerate(jobs):
+            if is_cancelled is not None and is_cancelled():
+                break
+            try:
+                _finish(_i, run_job(_job, _index_for(_job.vault)), None)
+            except Exception as e:
+                _finish(_i, None, e)
+        return results
+
+    # pandoc 路径与仓库索引只在主进程准备一次，子进程直接使用
+    _needs_pandoc = any(_job.extra_outputs or not is_markdown_output(_job.output) for _job in jobs)
+    _snapshots = {}
+    for _job in jobs:
+        _key = _vault_key(_job.vault)
+        if _key not in _snapshots:
+            _snapshots[_key] = _index_for(_job.vault).snapshot()
+    # 显式使用 spawn：界面进程中有 Qt 与其他线程（各自持有锁），fork 出的子进程可能在这些锁上死锁
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(jobs)),
+                             mp_context=multiprocessing.get_context("spawn"), initializer=_init_export_worker,
+                             initargs=(get_pandoc_path() if _needs_pandoc else None, _snapshots)) as executor:
+        _futures = {executor.submit(run_job, _job): _i for _i, _job in enumerate(jobs)}
+        for _future in as_completed(_futures):
+            _i = _futures[_future]
+            if _future.cancelled():
+                continue
+            try:
+                _finish(_i, _future.result(), None)
+            except Exception as e:
+                _finish(_i, None, e)
+            if is_cancelled is not None and is_cancelled():
+                for _pending in _futures:
+                    _pending.cancel()
+    return results
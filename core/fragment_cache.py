@@ -0,0 +1,119 @@
+﻿import os
+import sys
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class FragmentCache:
+    """
+    单个文件处理结果（预览片段）的 LRU 缓存，按占用内存上限淘汰。
+
+    键为 (路径, mtime, 文件大小, 规则指纹)；同时记录片段依赖的嵌入文件，
+    嵌入文件变化或链接解析到别的文件时，缓存同样视为失效。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size_bytes = 0
+        self._entries = OrderedDict()
+        self._latest_keys = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size_bytes(self):
+        return self._size_bytes
+
+    @staticmethod
+    def make_key(file_path, fingerprint):
+        """文件不存在时返回 None"""
+        try:
+            _stat = os.stat(file_path)
+        except OSError:
+            return None
+        return file_path, _stat.st_mtime_ns, _stat.st_size, fingerprint
+
+    def get(self, key, deps_valid=None):
+        """
+        命中时返回片段，否则返回 None。
+        deps_valid(deps) 用于校验依赖的嵌入文件，返回 False 时按未命中处理并丢弃该条目。
+        """
+        with self._lock:
+            _entry = self._entries.get(key)
+            if _entry is not None and deps_valid is not None and not deps_valid(_entry[1]):
+                self._remove(key)
+                _entry = None
+            if _entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return _entry[0]
+
+    def put(self, key, fragment, deps=()):
+        _size = sys.getsizeof(fragment)
+        with self._lock:
+            # 同一文件在同一规则下只保留最新版本
+            _old_key = self._latest_keys.get((key[0], key[3]))
+            if _old_key is not None and _old_key in self._entries:
+                self._remove(_old_key)
+            if key in self._entries:
+                self._remove(key)
+            if _size > self.max_bytes:
+                return
+            self._entries[key] = (fragment, tuple(deps), _size)
+            self._latest_keys[(key[0], key[3])] = key
+            self._size_bytes += _size
+            while self._size_bytes > self.max_bytes:
+                _evict_key = next(iter(self._entries))
+                self._remove(_evict_key)
+                self.evictions += 1
+
+    def invalidate(self, file_path):
+        with self._lock:
+            for _key in [_k for _k in self._entries if _k[0] == file_path]:
+                self._remove(_key)
+
+    def dependencies(self, file_path):
+        """缓存中该文件的片段所依赖的嵌入文件"""
+        with self._lock:
+            return {_dep[2] for _key, _entry in self._entries.items() if _key[0] == file_path
+                    for _dep in _entry[1] if _dep[2] is not None}
+
+    def dependents(self, file_path):
+        """缓存中嵌入了该文件的片段所属的文件"""
+        with self._lock:
+            return {_key[0] for _key, _entry in self._entries.items()
+                    if any(_dep[2] == file_path for _dep in _entry[1])}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._latest_keys.clear()
+            self._size_bytes = 0
+
+    def stats(self):
+        _total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self._size_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / _total if _total else 0.0,
+        }
+
+    def _remove(self, key):
+        _entry = self._entries.pop(key, None)
+        if _entry is not None:
+            self._size_bytes -= _entry[2]
+        if self._latest_keys.get((key[0], key[3])) == key:
+            del self._latest_keys[(key[0], key[3])]
@@ -0,0 +1,292 @@
+﻿import re
+from bisect import bisect_left
+from functools import lru_cache
+
+_HEADING_LINE_PATTERN = re.compile(r"^#", re.MULTILINE)
+
+
+class Heading:
+    """
+    文档中以 # 开头的一行。
+
+    start / line_end 为该行在文本中的起止偏移（line_end 指向换行符，最后一行没有换行符时等于文本长度），
+    hashes 为行首连续 # 的数量，spaced 表示 # 之后紧跟空格（即标准 ATX 标题），title 为去掉 # 与两端空白后的文字。
+    """
+    __slots__ = ("start", "line_end", "hashes", "spaced", "line", "title")
+
+    def __init__(self, start, line_end, hashes, spaced, line):
+        self.start = start
+        self.line_end = line_end
+        self.hashes = hashes
+        self.spaced = spaced
+        self.line = line
+        self.title = line[hashes:].strip()
+
+    def __repr__(self):
+        return f"Heading({self.start}, {self.line!r})"
+
+
+class Outline:
+    """
+    一次扫描得到的标题大纲，所有标题规则都在它上面以偏移区间的形式求值，
+    不再为每条规则单独构造正则并扫描全文。语义与 extract_section_regex / replace_section_title_regex 一致。
+    """
+
+    def __init__(self, markdown_text):
+        self.text = markdown_text
+        self.headings = []
+        self._starts = []
+        # 是否存在只有 # 的空标题行
+        self.has_untitled = False
+        self._parse()
+
+    def _parse(self):
+        _text = self.text
+        _length = len(_text)
+        # 只访问以 # 开头的行
+        for _match in _HEADING_LINE_PATTERN.finditer(_text):
+            _pos = _match.start()
+            _line_end = _text.find("\n", _pos)
+            if _line_end == -1:
+                _line_end = _length
+            _line = _text[_pos:_line_end]
+            _hashes = len(_line) - len(_line.lstrip("#"))
+            _heading = Heading(_pos, _line_end, _hashes, _line[_hashes:_hashes + 1] == " ", _line)
+            self.headings.append(_heading)
+            self._starts.append(_pos)
+            if not _heading.title:
+                self.has_untitled = True
+
+    def section_end(self, pos, header_level):
+        """
+        从 pos 起第一个终止标题的起始偏移：带级别的规则遇到 1~header_level 级标准标题终止，
+        不带级别的规则遇到任意以 # 开头的行终止。
+        """
+        for _index in range(bisect_left(self._starts, pos), len(self.headings)):
+            _heading = self.headings[_index]
+            if header_level == 0 or (_heading.spaced and _heading.hashes <= header_level):
+                return _heading.start
+        return len(self.text)
+
+    def section_span(self, target_header):
+        """规则匹配的第一个章节（标题及其内容）的区间，不存在时返回 None"""
+        return compile_heading_rules((target_header,)).section_spans(self)[0]
+
+    def heading_spans(self, target_header):
+        """规则匹配的所有标题行（含其后空白行）的区间"""
+        return compile_heading_rules((target_header,)).heading_spans(self)
+
+
+class HeadingRule:
+    """一条标题规则预先计算好的级别、查找键与正则"""
+    __slots__ = ("target", "level", "needs_regex", "title_pattern", "line_pattern", "section_pattern")
+
+    def __init__(self, target_header):
+        self.target = target_header
+        self.level = target_header.count("#")
+        self.needs_regex = _needs_regex(target_header)
+        self.title_pattern = re.compile(_title_pattern(target_header))
+        self.line_pattern = re.compile(rf"^{_title_pattern(target_header)}", re.MULTILINE)
+        self.section_pattern = _section_pattern(target_header)
+
+
+class HeadingRuleSet:
+    """
+    编译后的一组标题规则。规则按查找键放入两张表：带 # 的规则以整行为键，不带 # 的规则以标题文字为键，
+    对一篇文档只需遍历一次大纲，每个标题做常数次查表即可得到所有规则的匹配，可在多个文件和多次刷新之间复用。
+    """
+
+    def __init__(self, target_headers):
+        self.rules = [HeadingRule(_target) for _target in target_headers]
+        self._by_line = {}
+        self._by_title = {}
+        # 不带 # 的规则都可能从空标题行开始跨行匹配
+        self._untitled = []
+        self._regex_rules = []
+        for _index, _rule in enumerate(self.rules):
+            if _rule.needs_regex:
+                self._regex_rules.append(_index)
+            elif _rule.level != 0:
+                self._by_line.setdefault(_rule.target.rstrip(), []).append(_index)
+            else:
+                self._by_title.setdefault(_rule.target.strip(), []).append(_index)
+                self._untitled.append(_index)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def match(self, outline):
+        """
+        一次遍历大纲，返回每条规则匹配到的 [(标题, 标题部分结束偏移)]，按出现顺序且互不重叠。
+        需要正则处理的规则返回空列表，由 section_spans / heading_spans 单独处理。
+        """
+        _text = outline.text
+        _matches = [[] for _ in self.rules]
+        _last_end = [0] * len(self.rules)
+        for _heading in outline.headings:
+            for _index in self.candidates(_heading.line, _heading.title):
+                if _heading.start < _last_end[_index]:
+                    continue
+                _match = self.rules[_index].title_pattern.match(_text, _heading.start)
+                if _match:
+                    _matches[_index].append((_heading, _match.end()))
+                    _last_end[_index] = _match.end()
+        return _matches
+
+    def candidates(self, line, title):
+        """可能从这一标题行开始匹配的规则序号，还需用 title_pattern 确认"""
+        _candidates = self._by_line.get(line.rstrip(), [])
+        return _candidates + (self._by_title.get(title, []) if title else self._untitled)
+
+    def section_spans(self, outline):
+        """每条规则匹配的第一个章节（标题及其内容）的区间，不存在时为 None"""
+        _spans = []
+        for _rule, _matched in zip(self.rules, self.match(outline)):
+            if _rule.needs_regex:
+                _match = _rule.section_pattern.search(outline.text)
+                _spans.append(_match.span() if _match else None)
+            elif _matched:
+                _heading, _header_end = _matched[0]
+                _spans.append((_heading.start, outline.section_end(_header_end, _rule.level)))
+            else:
+                _spans.append(None)
+        return _spans
+
+    def heading_spans(self, outline):
+        """所有规则匹配的标题行（含其后空白行）的区间"""
+        _spans = []
+        for _rule, _matched in zip(self.rules, self.match(outline)):
+            if _rule.needs_regex:
+                _spans.extend(_match.span() for _match in _rule.line_pattern.finditer(outline.text))
+            else:
+                _spans.extend((_heading.start, _header_end) for _heading, _header_end in _matched)
+        return _spans
+
+
+@lru_cache(maxsize=256)
+def compile_heading_rules(target_headers):
+    return HeadingRuleSet(target_headers)
+
+
+def _as_rule_set(target_headers):
+    if isinstance(target_headers, HeadingRuleSet):
+        return target_headers
+    return compile_heading_rules(tuple(target_headers))
+
+
+def _needs_regex(target_header):
+    # 规则中间含 # 但不以 # 开头时，匹配的可能不是标题行，交给原始正则处理
+    return "#" in target_header and not target_header.startswith("#")
+
+
+def _title_pattern(title):
+    # 匹配标题的正则，忽略标题的级别（任意数量的 #）
+    if title.count("#") != 0:
+        return rf"{re.escape(title)}\s*\n"
+    return rf"#+\s*{re.escape(title)}\s*\n"
+
+
+def _section_pattern(target_header):
+    header_level = target_header.count("#")
+    if header_level != 0:
+        pattern = rf"(^{re.escape(target_header)}\s*\n)(.*?)(?=^#{{1,{header_level}}} |\Z)"
+    else:
+        pattern = rf"(^#+\s*{re.escape(target_header)}\s*\n)(.*?)(?=^#|\Z)"
+    return re.compile(pattern, re.MULTILINE | re.DOTALL)
+
+
+def _remove_spans(text, spans):
+    # 合并重叠区间后一次性拼接
+    _parts = []
+    _pos = 0
+    for _start, _end in sorted(spans):
+        if _end <= _pos:
+            continue
+        _parts.append(text[_pos:max(_start, _pos)])
+        _pos = _end
+    _parts.append(text[_pos:])
+    return "".join(_parts)
+
+
+def strip_front_matter(markdown_text):
+    # 去除文档开头 --- 包裹的元数据，正文中的分隔线保持不变
+    if not markdown_text.startswith("---"):
+        return markdown_text
+    _parts = markdown_text.split("---", 2)
+    return _parts[2] if len(_parts) > 2 else markdown_text
+
+
+def extract_section(markdown_text, target_header, outline=None):
+    # 捕获从目标标题开始到下一个同级或更高级标题为止的所有内容
+    outline = outline or Outline(markdown_text)
+    _span = outline.section_span(target_header)
+    return markdown_text[_span[0]:_span[1]] if _span else None
+
+
+def replace_section_title(markdown_text, old_title, new_title, outline=None):
+    # 替换标题，不影响内容
+    outline = outline or Outline(markdown_text)
+    _parts = []
+    _pos = 0
+    for _start, _end in outline.heading_spans(old_title):
+        _parts.append(markdown_text[_pos:_start])
+        _parts.append(new_title)
+        _pos = _end
+    _parts.append(markdown_text[_pos:])
+    return "".join(_parts)
+
+
+def include_sections(markdown_text, target_headers):
+    # 仅包含标题：各规则匹配的章节按规则顺序拼接，一个都没有时保留全文
+    _rule_set = _as_rule_set(target_headers)
+    if not _rule_set:
+        return markdown_text
+    _sections = [markdown_text[_span[0]:_span[1]] for _span in _rule_set.section_spans(Outline(markdown_text))
+                 if _span]
+    _sections = [_section for _section in _sections if _section]
+    return "\n\n".join(_sections) if _sections else markdown_text
+
+
+def exclude_sections(markdown_text, target_headers):
+    # 不包含标题：删除各规则匹配章节的并集
+    _rule_set = _as_rule_set(target_headers)
+    if not _rule_set:
+        return markdown_text
+    _spans = _rule_set.section_spans(Outline(markdown_text))
+    return _remove_spans(markdown_text, [_span for _span in _spans if _span])
+
+
+def hide_headings(markdown_text, target_headers):
+    # 隐藏标题：删除所有匹配的标题行，保留其内容
+    _rule_set = _as_rule_set(target_headers)
+    if not _rule_set:
+        return markdown_text
+    _outline = Outline(markdown_text)
+    if _outline.has_untitled and len(_rule_set) > 1:
+        # 存在只有 # 的空标题行时，删除一个标题可能让它与下一行连成新的标题，只能逐条规则依次处理
+        for _rule in _rule_set.rules:
+            markdown_text = replace_section_title(markdown_text, _rule.target, "", _outline)
+            _outline = Outline(markdown_text)
+        return markdown_text
+    return _remove_spans(markdown_text, _rule_set.heading_spans(_outline))
+
+
+# 以下为逐条规则构造正则的原始实现，保留用于对照校验大纲解析的结果
+
+def replace_section_title_regex(markdown_text, old_title, new_title):
+    pattern = rf"(^{_title_pattern(old_title)})"
+    # 替换标题，不影响内容
+    replacement = rf"{new_title}"  # 替换为新标题（可调整级别）
+    # 使用 re.MULTILINE 保证 ^ 匹配行首
+    updated_text = re.sub(pattern, replacement, markdown_text, flags=re.MULTILINE)
+    return updated_text
+
+
+def extract_section_regex(markdown_text, target_header):
+    # 构建目标标题的正则模式，包括内容及子标题
+    # 捕获从目标标题开始到下一个同级或更高级标题为止的所有内容
+    match = _section_pattern(target_header).search(markdown_text)
+    if match:
+        return match.group(0)  # 返回匹配到的内容
+    else:
+        return None
@@ -0,0 +1,175 @@
+﻿import os
+import re
+
+from core.markdown_sections import include_sections, exclude_sections, hide_headings, strip_front_matter
+from core.profiling import NULL_PROFILE
+from core.rules import compile_rules
+from core.section_reader import read_sections
+from core.selection import SelectionExpander
+from core.transclusion import TransclusionResolver, file_signature
+
+# 预览/导出文档的开头，空的元数据块避免首个分隔线被识别为 YAML
+DOCUMENT_HEAD = "---\n\n---\n\n"
+# 文件之间的分隔线
+FILE_SEPARATOR = "---\n\n"
+
+
+def collect_files(paths, vault_index=None, selection_filter=None):
+    """
+    将选中的文件/文件夹展开为文件列表（去重、保持选择顺序），文件夹递归展开，
+    按 selection_filter 过滤扩展名与忽略规则（默认只保留 .md），并跳过隐藏文件和二进制附件。
+    传入 vault_index 时，仓库内的文件夹直接从索引展开，不再遍历磁盘。
+    """
+    _root_path = vault_index.root_path if vault_index is not None else None
+    return SelectionExpander(selection_filter, _root_path).expand(paths, vault_index)
+
+
+def file_title(file_path):
+    _name = os.path.basename(file_path)
+    return _name[:-3] if _name.endswith(".md") else _name
+
+
+def render_file(file_path, rules, vault_index, cache=None, fingerprint=None, resolver=None, profile=NULL_PROFILE):
+    """
+    处理单个文件，返回预览片段。传入 cache 时优先使用缓存，未命中才重新处理并写回缓存。
+    缓存的是不含文件标题和分隔线的正文，切换这两项时不需要重新处理。
+    同一次渲染的多个文件应共用一个 resolver，使被多处嵌入的笔记只展开一次。
+    profile（RunProfile）记录各处理阶段的耗时。
+    """
+    resolver = resolver or TransclusionResolver(vault_index, rules.embed_depth, vault_index.database)
+    if cache is None:
+        return decorate_fragment(file_path, _render_file(file_path, rules, resolver, profile)[0], rules)
+
+    fingerprint = fingerprint or rules.fingerprint()
+    _key = cache.make_key(file_path, fingerprint)
+    if _key is not None:
+        _body = cache.get(_key, lambda deps: _deps_valid(deps, vault_index))
+        if _body is not None:
+            profile.count("cache_hits")
+            profile.add_input(files=1)
+            return decorate_fragment(file_path, _body, rules)
+    profile.count("cache_misses")
+    _body, _deps = _render_file(file_path, rules, resolver, profile)
+    if _key is not None:
+        cache.put(_key, _body, _deps)
+    return decorate_fragment(file_path, _body, rules)
+
+
+def decorate_fragment(file_path, body, rules):
+    # 为正文加上文件标题与分隔线
+    content = "# " + file_title(file_path) + "\n\n" if not rules.hide_file_header else ""
+    content += body + "\n\n"
+    content += FILE_SEPARATOR if not rules.hide_separator else ""
+    return content
+
+
+def _deps_valid(deps, vault_index):
+    # 每个嵌入链接需仍解析到同一文件，且该文件未被修改
+    for _link, _source, _path, _signature in deps:
+        if vault_index.resolve(_link, _source) != _path:
+            return False
+        if _path is not None and file_signature(_path) != _signature:
+            return False
+    return True
+
+
+def _render_file(file_path, rules, resolver, profile=NULL_PROFILE):
+    _compiled = compile_rules(rules)
+    f_read = _read_included(file_path, _compiled.only_include, resolver.database, profile)
+    if f_read is None:
+        with open(file_path, "r", encoding="utf-8") as f:
+            _size = os.fstat(f.fileno()).st_size
+            with profile.stage("read", files=1, size=_size, detail=file_path):
+                f_read = f.read()
+        profile.add_input(files=1, size=_size)
+
+        # 去除文档开头的元数据
+        with profile.stage("front_matter"):
+            f_read = strip_front_matter(f_read)
+
+        # 仅包含标题
+        with profile.stage("include"):
+            f_read = include_sections(f_read, _compiled.only_include)
+
+    # 不包含标题
+    with profile.stage("exclude"):
+        f_read = exclude_sections(f_read, _compiled.only_exclude)
+
+    # 递归展开 ![[inline]] 嵌入
+    with profile.stage("embeds", detail=file_path):
+        f_read, _deps = resolver.expand(f_read, file_path)
+
+    # 替换 [[link]] 链接
+    with profile.stage("wikilinks"):
+        pattern = r"\[\[([^\[\]|]+)\|?([^\[\]]*)\]\]"
+        f_read = re.sub(pattern, lambda m: m.group(2) if m.group(2) else m.group(1), f_read)
+
+    # 隐藏标题
+    with profile.stage("hide"):
+        f_read = hide_headings(f_read, _compiled.hide_header)
+    return f_read, _deps
+
+
+def _read_included(file_path, only_include, database, profile):
+    """
+    有仅包含标题时，按索引中的标题偏移只读取匹配的章节，结果与整篇读取后 include_sections 相同。
+    没有规则、一个章节都没有匹配到或无法按章节读取时返回 None，由调用方整篇读取。
+    """
+    if not only_include or database is None:
+        return None
+    with profile.stage("read_sections", detail=file_path):
+        _result = read_sections(file_path, only_include, database)
+    if _result is None:
+        return None
+    _sections, _bytes_read = _result
+    _sections = [_section for _section in _sections if _section]
+    if not _sections:
+        return None
+    profile.count("partial_reads")
+    profile.add_input(files=1, size=_bytes_read)
+    return "\n\n".join(_sections)
+
+
+def iter_document(files, rules, vault_index, is_cancelled=None, on_progress=None, cache=None, head=True,
+                  profile=NULL_PROFILE):
+    """
+    逐个文件生成文档片段，内存中同时只保留一个文件的内容，供流式导出使用。
+    is_cancelled() 返回 True 时停止生成；on_progress(done, total) 在每个文件完成后回调。
+    """
+    _fingerprint = rules.fingerprint() if cache is not None else None
+    _resolver = TransclusionResolver(vault_index, rules.embed_depth, vault_index.database)
+    try:
+        if head:
+            yield DOCUMENT_HEAD
+        for _done, _file in enumerate(files, 1):
+            if is_cancelled is not None and is_cancelled():
+                return
+            yield render_file(_file, rules, vault_index, cache, _fingerprint, _resolver, profile)
+            if on_progress is not None:
+                on_progress(_done, len(files))
+    finally:
+        profile.count("embed_lookups", _resolver.lookups)
+
+
+def render_document(files, rules, vault_index, is_cancelled=None, on_progress=None, cache=None,
+                    profile=NULL_PROFILE):
+    """
+    依次渲染所有文件并拼接为完整文档。
+    is_cancelled() 返回 True 时中途放弃并返回 None；on_progress(done, total) 在每个文件完成后回调。
+    """
+    content = "".join(iter_document(files, rules, vault_index, is_cancelled, on_progress, cache, profile=profile))
+    if is_cancelled is not None and is_cancelled():
+        return None
+    return content
+
+
+def render_fragments(files, rules, vault_index, is_cancelled=None, on_progress=None, cache=None,
+                     profile=NULL_PROFILE):
+    """
+    渲染各文件的片段并按文件返回列表（不含文档开头），供预览按文件分块显示；中途取消时返回 None。
+    """
+    fragments = list(iter_document(files, rules, vault_index, is_cancelled, on_progress, cache, head=False,
+                                   profile=profile))
+    if is_cancelled is not None and is_cancelled():
+        return None
+    return fragments
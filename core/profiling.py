@@ -0,0 +1,207 @@
+﻿import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 记录方式：只统计各阶段耗时 / 额外输出 Chrome 跟踪（chrome://tracing、Perfetto 可打开）/ 额外输出 cProfile 数据
+PROFILE_OFF = "off"
+PROFILE_TRACE = "trace"
+PROFILE_CPROFILE = "cprofile"
+
+STAGE_LABELS = {
+    "collect": "展开选择",
+    "read": "读取",
+    "read_sections": "按章节读取",
+    "front_matter": "元数据",
+    "include": "仅包含",
+    "exclude": "不包含",
+    "embeds": "嵌入",
+    "wikilinks": "链接",
+    "hide": "隐藏标题",
+    "layout": "排版",
+    "write": "写入",
+    "pandoc": "pandoc",
+    "parse_ast": "解析 AST",
+    "convert": "转换",
+}
+COUNTER_LABELS = {
+    "embed_lookups": "嵌入查找",
+    "cache_hits": "缓存命中",
+    "cache_misses": "缓存未命中",
+    "ast_cache_hits": "AST 缓存命中",
+    "partial_reads": "按章节读取",
+}
+
+
+class StageStats:
+    __slots__ = ("name", "seconds", "calls", "files", "bytes")
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.calls = 0
+        self.files = 0
+        self.bytes = 0
+
+    @property
+    def label(self):
+        return STAGE_LABELS.get(self.name, self.name)
+
+
+class RunProfile:
+    """
+    一次预览刷新或导出的分阶段计时。各阶段可在不同线程中多次进入，耗时、文件数与字节数累加；
+    mode 为 PROFILE_TRACE 时同时记录每次进入的时间线，结束后可写出 Chrome 跟踪文件。
+    """
+
+    def __init__(self, name, mode=PROFILE_OFF):
+        self.name = name
+        self.mode = mode
+        self.stages = {}
+        self.counters = {}
+        self.files = 0
+        self.bytes = 0
+        self.seconds = None
+        self.output_paths = []
+        self._started = time.perf_counter()
+        self._events = []
+        self._profiler = None
+        self._lock = threading.Lock()
+
+    def stage(self, name, files=0, size=0, detail=None):
+        """with profile.stage("read", files=1, size=n): ... 记录一次阶段耗时"""
+        return _Stage(self, name, files, size, detail)
+
+    def _record(self, name, start, end, files, size, detail):
+        with self._lock:
+            _stats = self.stages.get(name)
+            if _stats is None:
+                _stats = self.stages[name] = StageStats(name)
+            _stats.seconds += end - start
+            _stats.calls += 1
+            _stats.files += files
+            _stats.bytes += size
+            if self.mode == PROFILE_TRACE:
+                self._events.append((name, start, end, threading.get_ident(), detail))
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_input(self, files=0, size=0):
+        """记录处理的源文件数与字节数"""
+        with self._lock:
+            self.files += files
+            self.bytes += size
+
+    @contextmanager
+    def profiled(self):
+        """mode 为 PROFILE_CPROFILE 时，对当前线程中执行的代码做 cProfile 采样"""
+        if self.mode != PROFILE_CPROFILE:
+            yield
+            return
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+        try:
+            yield
+        finally:
+            _profiler.disable()
+            self._profiler = _profiler
+
+    def finish(self, output_dir=None):
+        """结束计时；指定 output_dir 且开启了跟踪时写出跟踪文件，返回写出的文件路径"""
+        self.seconds = time.perf_counter() - self._started
+        if output_dir and self.mode != PROFILE_OFF:
+            os.makedirs(output_dir, exist_ok=True)
+            _base = os.path.join(output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{self.name}")
+            if self.mode == PROFILE_TRACE:
+                self.output_paths.append(self.write_chrome_trace(_base + ".trace.json"))
+            elif self._profiler is not None:
+                self._profiler.dump_stats(_base + ".prof")
+                self.output_paths.append(_base + ".prof")
+        return self.output_paths
+
+    def write_chrome_trace(self, path):
+        _pid = os.getpid()
+        _events = []
+        with self._lock:
+            for _name, _start, _end, _thread, _detail in self._events:
+                _event = {"name": STAGE_LABELS.get(_name, _name), "cat": _name, "ph": "X", "pid": _pid,
+                          "tid": _thread, "ts": (_start - self._started) * 1e6, "dur": (_end - _start) * 1e6}
+                if _detail:
+                    _event["args"] = {"file": _detail}
+                _events.append(_event)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": _events, "displayTimeUnit": "ms",
+                       "otherData": {"run": self.name, "counters": self.counters}}, f, ensure_ascii=False)
+        return path
+
+    def summary(self, limit=5):
+        """状态栏用的一行摘要：总耗时与最耗时的几个阶段"""
+        _stages = sorted(self.stages.values(), key=lambda _stats: _stats.seconds, reverse=True)[:limit]
+        _parts = [f"{_stats.label} {_stats.seconds:.2f}s" for _stats in _stages]
+        _total = f"{self.seconds:.2f}s" if self.seconds is not None else "进行中"
+        return f"{self.name} {_total}：" + " · ".join(_parts) + \
+            f"｜{self.files} 个文件 {self.bytes / 1024 / 1024:.1f} MB，" \
+            f"{COUNTER_LABELS['embed_lookups']} {self.counters.get('embed_lookups', 0)}"
+
+    def rows(self):
+        """详情表格：[(阶段, 耗时, 次数, 文件数, 字节数)]，按耗时降序"""
+        return [(_stats.label, _stats.seconds, _stats.calls, _stats.files, _stats.bytes)
+                for _stats in sorted(self.stages.values(), key=lambda _stats: _stats.seconds, reverse=True)]
+
+
+class _Stage:
+    # 比 @contextmanager 生成器开销小，适合每个文件的每个阶段都进入一次
+    __slots__ = ("_profile", "_name", "_files", "_size", "_detail", "_start")
+
+    def __init__(self, profile, name, files, size, detail):
+        self._profile = profile
+        self._name = name
+        self._files = files
+        self._size = size
+        self._detail = detail
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._profile._record(self._name, self._start, time.perf_counter(), self._files, self._size, self._detail)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _NullProfile:
+    """未开启计时时使用，所有记录都是空操作，热路径上不需要判断 profile 是否为 None"""
+    mode = PROFILE_OFF
+
+    def stage(self, name, files=0, size=0, detail=None):
+        return _NULL_STAGE
+
+    def count(self, name, value=1):
+        pass
+
+    def add_input(self, files=0, size=0):
+        pass
+
+    @contextmanager
+    def profiled(self):
+        yield
+
+
+NULL_PROFILE = _NullProfile()
@@ -0,0 +1,45 @@
+﻿import hashlib
+from collections import namedtuple
+from dataclasses import dataclass, astuple, replace
+from functools import lru_cache
+
+from core.markdown_sections import compile_heading_rules
+from core.transclusion import DEFAULT_EMBED_DEPTH
+
+CompiledRules = namedtuple("CompiledRules", ["only_include", "only_exclude", "hide_header"])
+
+
+@dataclass(frozen=True)
+class ExportRules:
+    """
+    导出规则的不可变快照。
+
+    界面线程在每次刷新时从列表控件读出规则，后台线程只访问这个快照，不再接触 Qt 控件。
+    """
+    only_include: tuple = ()
+    only_exclude: tuple = ()
+    hide_header: tuple = ()
+    hide_file_header: bool = False
+    hide_separator: bool = False
+    # 嵌入展开的最大层数
+    embed_depth: int = DEFAULT_EMBED_DEPTH
+
+    def fingerprint(self):
+        """
+        影响文件正文的规则的哈希，用作片段缓存键的一部分。
+        文件标题与分隔线只是片段的外框，切换它们时缓存的正文仍然可用。
+        """
+        _body_rules = replace(self, hide_file_header=False, hide_separator=False)
+        return hashlib.sha1(repr(astuple(_body_rules)).encode("utf-8")).hexdigest()
+
+
+@lru_cache(maxsize=32)
+def compile_rules(rules):
+    """
+    将三组标题规则编译为匹配器。规则快照不变时直接复用上次的结果，只有列表被修改后才重新编译。
+    """
+    return CompiledRules(
+        compile_heading_rules(rules.only_include),
+        compile_heading_rules(rules.only_exclude),
+        compile_heading_rules(rules.hide_header),
+    )
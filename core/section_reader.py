@@ -0,0 +1,60 @@
+﻿import os
+
+# 小于这个大小的笔记直接整篇读取，按章节读取省下的 I/O 抵不过查询索引的开销
+PARTIAL_READ_MIN_BYTES = 64 * 1024
+
+
+def read_sections(file_path, rule_set, database, min_bytes=PARTIAL_READ_MIN_BYTES):
+    """
+    按持久化索引（VaultDatabase）中标题的字节偏移，只读取 rule_set（HeadingRuleSet）中各条规则匹配的第一个章节。
+    返回 ([各规则的章节文本或 None], 读取的字节数)，与整篇读取后 strip_front_matter 再按规则截取的结果一致。
+
+    文件小于 min_bytes、mtime/大小与索引不符、规则需要正则处理或文件中有单独的 \\r 换行时返回 None，
+    由调用方整篇读取。
+    """
+    if database is None or any(_rule.needs_regex for _rule in rule_set.rules):
+        return None
+    try:
+        with open(file_path, "rb") as f:
+            _stat = os.fstat(f.fileno())
+            if _stat.st_size < min_bytes:
+                return None
+            _outline = database.note_outline(file_path)
+            if _outline is None or _outline.lone_cr or \
+                    (_outline.mtime_ns, _outline.size) != (_stat.st_mtime_ns, _stat.st_size):
+                return None
+            return _read_spans(f, rule_set, _outline)
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _read_spans(f, rule_set, outline):
+    _front_matter_end = outline.front_matter_end
+    if _front_matter_end:
+        # 元数据结束处紧跟 # 时，去掉元数据后这一行才成为标题，索引中没有它
+        f.seek(_front_matter_end)
+        if f.read(1) == b"#":
+            return None
+    _headings = [_heading for _heading in outline.headings if _heading.start_byte >= _front_matter_end]
+    _bytes_read = 0
+    sections = []
+    for _index, _rule in enumerate(rule_set.rules):
+        _section = None
+        for _position, _heading in enumerate(_headings):
+            if _index not in rule_set.candidates(_heading.line, _heading.line[_heading.hashes:].strip()):
+                continue
+            # 章节到下一个终止标题为止：带级别的规则遇到同级或更高级标准标题，不带级别的规则遇到任意标题
+            _end = outline.size
+            for _next in _headings[_position + 1:]:
+                if _rule.level == 0 or (_next.spaced and _next.hashes <= _rule.level):
+                    _end = _next.start_byte
+                    break
+            f.seek(_heading.start_byte)
+            _text = f.read(_end - _heading.start_byte).decode("utf-8").replace("\r\n", "\n")
+            _bytes_read += _end - _heading.start_byte
+            # 与整篇匹配时相同：标题行之后需有换行，空标题还需在后续行匹配到标题文字
+            if _rule.title_pattern.match(_text):
+                _section = _text
+                break
+        sections.append(_section)
+    return sections, _bytes_read
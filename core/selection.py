@@ -0,0 +1,192 @@
+﻿import os
+import re
+from dataclasses import dataclass
+
+from core.vault_index import IGNORED_DIR_NAMES
+
+DEFAULT_EXTENSIONS = (".md",)
+# 判断二进制文件时读取的字节数
+BINARY_SNIFF_BYTES = 8192
+
+
+@dataclass(frozen=True)
+class SelectionFilter:
+    """
+    展开文件夹时的过滤条件。extensions 为空表示不限扩展名；
+    ignore_patterns 为 .gitignore 风格的 glob（"*.pdf"、"attachments/"、"/drafts/**"、"!keep.md"）。
+    """
+    extensions: tuple = DEFAULT_EXTENSIONS
+    ignore_patterns: tuple = ()
+    skip_hidden: bool = True
+
+
+class IgnoreMatcher:
+    """
+    .gitignore 风格的匹配：以 / 结尾只匹配目录；包含 / 的模式相对根目录锚定，否则匹配任意层级的名称；
+    支持 *、?、**、[...]，以 ! 开头的模式重新包含之前被忽略的路径，后出现的模式优先。
+    """
+
+    def __init__(self, patterns):
+        self._rules = []
+        for _pattern in patterns:
+            _pattern = _pattern.strip()
+            if not _pattern or _pattern.startswith("#"):
+                continue
+            _negate = _pattern.startswith("!")
+            _pattern = _pattern[1:] if _negate else _pattern
+            _dir_only = _pattern.endswith("/")
+            _pattern = _pattern.rstrip("/")
+            _anchored = "/" in _pattern
+            _regex = _glob_to_regex(_pattern.lstrip("/"))
+            if not _anchored:
+                _regex = "(?:.*/)?" + _regex
+            self._rules.append((re.compile(_regex + r"\Z"), _negate, _dir_only))
+
+    def __bool__(self):
+        return bool(self._rules)
+
+    def is_ignored(self, relative_path, is_dir):
+        _ignored = False
+        for _regex, _negate, _dir_only in self._rules:
+            if _dir_only and not is_dir:
+                continue
+            if _regex.match(relative_path):
+                _ignored = not _negate
+        return _ignored
+
+
+def _glob_to_regex(pattern):
+    _parts = []
+    _i = 0
+    while _i < len(pattern):
+        _char = pattern[_i]
+        if pattern.startswith("**/", _i):
+            _parts.append("(?:.*/)?")
+            _i += 3
+            continue
+        if pattern.startswith("**", _i):
+            _parts.append(".*")
+            _i += 2
+            continue
+        if _char == "*":
+            _parts.append("[^/]*")
+        elif _char == "?":
+            _parts.append("[^/]")
+        elif _char == "[":
+            _end = pattern.find("]", _i + 1)
+            if _end == -1:
+                _parts.append(re.escape(_char))
+            else:
+                _class = pattern[_i + 1:_end]
+                _parts.append("[" + ("^" + _class[1:] if _class.startswith("!") else _class) + "]")
+                _i = _end
+        else:
+            _parts.append(re.escape(_char))
+        _i += 1
+    return "".join(_parts)
+
+
+def is_binary_file(file_path):
+    """文件开头含 NUL 字节时视为二进制附件（图片、PDF 等），不作为文本读取"""
+    try:
+        with open(file_path, "rb") as f:
+            return b"\0" in f.read(BINARY_SNIFF_BYTES)
+    except OSError:
+        return True
+
+
+class SelectionExpander:
+    """
+    将选中的文件/文件夹展开为文件列表：os.scandir 遍历、遍历时即按扩展名与忽略规则剪枝，
+    默认跳过 Obsidian 的内部目录和隐藏文件，结果以有序集合去重并保持选择顺序。
+    显式选中的单个文件不受扩展名与忽略规则影响，但二进制文件总会被跳过。
+    """
+
+    def __init__(self, selection_filter=None, root_path=None):
+        self.filter = selection_filter or SelectionFilter()
+        self.root_path = os.path.normpath(os.path.abspath(root_path)) if root_path else None
+        self._extensions = tuple(_ext.lower() for _ext in self.filter.extensions)
+        self._ignore = IgnoreMatcher(self.filter.ignore_patterns)
+        self._dir_ignored = {}
+
+    def expand(self, paths, vault_index=None):
+        files = {}
+        for _path in paths:
+            _path = os.path.normpath(os.path.abspath(_path))
+            if vault_index is not None and self.filter.skip_hidden and vault_index.contains_dir(_path):
+                # 仓库内的文件夹直接从内存索引展开，不再遍历磁盘
+                _base = self.root_path if self._is_inside_root(_path) else _path
+                for _file in vault_index.files_under(_path):
+                    if self._accept_indexed(_file, _base):
+                        files.setdefault(_file, None)
+            elif os.path.isdir(_path):
+                for _file in self._scan(_path):
+                    files.setdefault(_file, None)
+            elif os.path.isfile(_path) and not is_binary_file(_path):
+                files.setdefault(_path, None)
+        return list(files)
+
+    def _scan(self, dir_path):
+        _base = self.root_path if self._is_inside_root(dir_path) else dir_path
+        _stack = [dir_path]
+        while _stack:
+            _dir = _stack.pop()
+            try:
+                with os.scandir(_dir) as _it:
+                    _entries = sorted(_it, key=lambda _entry: _entry.name)
+            except OSError:
+                continue
+            _sub_dirs = []
+            for _entry in _entries:
+                if self._skip_name(_entry.name):
+                    continue
+                try:
+                    _is_dir = _entry.is_dir()
+                    _is_file = not _is_dir and _entry.is_file()
+                except OSError:
+                    continue
+                if _is_dir:
+                    if not self._ignored(_entry.path, _base, True):
+                        _sub_dirs.append(_entry.path)
+                elif _is_file and not self._ignored(_entry.path, _base, False) \
+                        and self._accept_file(_entry.path):
+                    yield _entry.path
+            # 先当前目录的文件，再按名称顺序进入子目录
+            _stack.extend(reversed(_sub_dirs))
+
+    def _accept_indexed(self, file_path, base):
+        # 索引本身已跳过隐藏文件与 Obsidian 内部目录
+        if not self._ignore:
+            return self._accept_file(file_path)
+        # 任一上级目录被忽略时文件也被忽略
+        _dir = os.path.dirname(file_path)
+        while len(_dir) > len(base):
+            _ignored = self._dir_ignored.get(_dir)
+            if _ignored is None:
+                _ignored = self._dir_ignored[_dir] = self._ignored(_dir, base, True)
+            if _ignored:
+                return False
+            _dir = os.path.dirname(_dir)
+        return not self._ignored(file_path, base, False) and self._accept_file(file_path)
+
+    def _skip_name(self, name):
+        if name in IGNORED_DIR_NAMES:
+            return True
+        return self.filter.skip_hidden and name.startswith(".")
+
+    def _accept_extension(self, name):
+        return not self._extensions or name.lower().endswith(self._extensions)
+
+    def _accept_file(self, file_path):
+        # 指定了扩展名时只看名称，不限扩展名时才需要打开文件检查内容
+        if self._extensions:
+            return self._accept_extension(file_path)
+        return not is_binary_file(file_path)
+
+    def _ignored(self, path, base, is_dir):
+        if not self._ignore:
+            return False
+        return self._ignore.is_ignored(os.path.relpath(path, base).replace(os.sep, "/"), is_dir)
+
+    def _is_inside_root(self, path):
+        return self.root_path is not None and (path == self.root_path or path.startswith(self.root_path + os.sep))
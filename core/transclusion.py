@@ -0,0 +1,130 @@
+﻿import os
+import re
+
+from core.markdown_sections import extract_section, strip_front_matter, compile_heading_rules
+from core.section_reader import read_sections
+
+# 嵌入展开的默认最大层数
+DEFAULT_EMBED_DEPTH = 5
+
+EMBED_PATTERN = re.compile(r"!\[\[(.+?)\]\]")  # 匹配 ![[link]] 的正则
+
+
+def parse_embed(inline_link):
+    """将 ![[...]] 中的内容拆分为 (笔记名, 章节)，忽略 | 之后的别名/尺寸"""
+    f_name, _, section_name = inline_link.split("|", 1)[0].partition("#")
+    return f_name, section_name
+
+
+def file_signature(file_path):
+    try:
+        _stat = os.stat(file_path)
+    except OSError:
+        return None
+    return _stat.st_mtime_ns, _stat.st_size
+
+
+class TransclusionResolver:
+    """
+    递归展开 ![[note]] / ![[note#section]] 嵌入。
+
+    一次渲染内共用一个实例：每个 (笔记, 章节) 的展开结果只计算一次，文件内容也只读取一次。
+    嵌入链超过 max_depth 层或出现循环时，对应的嵌入保持原样不展开。
+    已展开的结果只在当前位置也不会超过层数、不会形成循环时复用，结果与文件的渲染顺序无关。
+    每个展开结果都记录其（传递）依赖，格式为 (链接, 来源笔记, 解析到的文件, 文件签名)，供片段缓存校验。
+    传入 database（VaultDatabase）时，![[note#section]] 按索引中的标题偏移只读取该章节。
+    """
+
+    def __init__(self, vault_index, max_depth=DEFAULT_EMBED_DEPTH, database=None):
+        self.vault_index = vault_index
+        self.max_depth = max_depth
+        self.database = database
+        self._texts = {}
+        # (路径, 章节) -> (内容或 None, 依赖, 内部嵌入的最大层数, 内部展开过的全部键)
+        self._resolved = {}
+        self.lookups = 0
+
+    def expand(self, markdown_text, source_path):
+        """展开文本中的嵌入，返回 (展开后的文本, 依赖)"""
+        _expanded, _deps, _, _, _ = self._expand(markdown_text, source_path,
+                                                 [(os.path.normpath(source_path), "")])
+        return _expanded, _deps
+
+    def _expand(self, markdown_text, source_path, stack):
+        """返回 (展开后的文本, 依赖, 是否完整, 展开的嵌入最多有几层, 展开过的全部键)"""
+        _deps = []
+        _complete = True
+        _height = 0
+        _keys = set()
+
+        def _replace(_match):
+            nonlocal _complete, _height
+            _content, _link_deps, _link_complete, _link_height, _link_keys = \
+                self._resolve_link(_match.group(1), source_path, stack)
+            _deps.extend(_link_deps)
+            _complete = _complete and _link_complete
+            _height = max(_height, _link_height)
+            _keys.update(_link_keys)
+            return _content if _content is not None else _match.group(0)
+
+        _expanded = EMBED_PATTERN.sub(_replace, markdown_text)
+        return _expanded, _deps, _complete, _height, _keys
+
+    def _resolve_link(self, inline_link, source_path, stack):
+        f_name, section_name = parse_embed(inline_link)
+        # 通过仓库索引查找名称匹配的文件
+        self.lookups += 1
+        _j_file = self.vault_index.resolve(f_name, source_path)
+        _dep = (f_name, source_path, _j_file, file_signature(_j_file) if _j_file else None)
+        if not _j_file:
+            return None, [_dep], True, 0, ()
+
+        _key = (os.path.normpath(_j_file), section_name)
+        if _key in stack:
+            # 循环嵌入
+            return None, [_dep], False, 0, ()
+        if len(stack) > self.max_depth:
+            return None, [_dep], False, 0, ()
+        _memo = self._resolved.get(_key)
+        if _memo is not None:
+            _content, _deps, _height, _keys = _memo
+            # 在更深的位置或所在嵌入链中已有其内部的笔记时，复用会越过层数限制或漏掉循环，需重新展开
+            if _content is None or (len(stack) + _height - 1 <= self.max_depth and _keys.isdisjoint(stack)):
+                return _content, [_dep] + _deps, True, _height, _keys
+
+        _body = self._read_section(_j_file, section_name) if section_name else None
+        if _body is None:
+            _text = self._read(_j_file)
+            if _text is None:
+                return None, [_dep], True, 0, ()
+            _body = strip_front_matter(_text)
+            if section_name:
+                _body = extract_section(_body, section_name)
+        if section_name and not _body:
+            self._resolved[_key] = (None, [], 0, frozenset())
+            return None, [_dep], True, 0, ()
+        _body, _deps, _complete, _height, _keys = self._expand(_body, _j_file, stack + [_key])
+        _height += 1
+        _keys = frozenset(_keys | {_key})
+        # 因循环或层数限制而截断的结果依赖于嵌入路径，不缓存
+        if _complete:
+            self._resolved[_key] = (_body, _deps, _height, _keys)
+        return _body, [_dep] + _deps, _complete, _height, _keys
+
+    def _read_section(self, file_path, section_name):
+        # 整篇已读入时直接截取；否则按索引只读取该章节，未找到章节时返回空字符串，无法按章节读取时返回 None
+        if file_path in self._texts:
+            return None
+        _result = read_sections(file_path, compile_heading_rules((section_name,)), self.database)
+        if _result is None:
+            return None
+        return _result[0][0] or ""
+
+    def _read(self, file_path):
+        if file_path not in self._texts:
+            try:
+                with open(file_path, "r", encoding="utf-8") as j:
+                    self._texts[file_path] = j.read()
+            except (OSError, UnicodeDecodeError):
+                self._texts[file_path] = None
+        return self._texts[file_path]
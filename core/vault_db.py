@@ -0,0 +1,310 @@
+﻿import hashlib
+import os
+import re
+import sqlite3
+import sys
+import threading
+
+from core.markdown_sections import Outline, strip_front_matter
+from core.vault_index import IGNORED_DIR_NAMES
+
+SCHEMA_VERSION = 2
+# sync() 每读取并解析这么多篇笔记写入一次，数据库锁只在写入时持有
+SYNC_BATCH_NOTES = 50
+
+# 匹配 [[link]] 与 ![[embed]]
+_LINK_PATTERN = re.compile(r"(!?)\[\[([^\[\]]+?)\]\]")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER);
+CREATE TABLE IF NOT EXISTS notes (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    name_lower TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    front_matter_end_byte INTEGER NOT NULL DEFAULT 0,
+    lone_cr INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS notes_name ON notes (name_lower);
+CREATE INDEX IF NOT EXISTS notes_dir ON notes (dir);
+CREATE TABLE IF NOT EXISTS headings (
+    note TEXT NOT NULL,
+    ord INTEGER NOT NULL,
+    line TEXT NOT NULL,
+    hashes INTEGER NOT NULL,
+    spaced INTEGER NOT NULL,
+    start_byte INTEGER NOT NULL,
+    line_end_byte INTEGER NOT NULL,
+    PRIMARY KEY (note, ord)
+);
+CREATE TABLE IF NOT EXISTS links (
+    note TEXT NOT NULL,
+    target TEXT NOT NULL,
+    target_lower TEXT NOT NULL,
+    section TEXT NOT NULL,
+    is_embed INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS links_note ON links (note);
+CREATE INDEX IF NOT EXISTS links_target ON links (target_lower);
+"""
+
+
+def user_cache_dir():
+    # 用户缓存目录下的应用目录，索引、AST 等缓存都放在这里，不写入仓库本身
+    if sys.platform == "win32":
+        _base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        _base = os.path.expanduser("~/Library/Caches")
+    else:
+        _base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(_base, "ObsidianExporter")
+
+
+def default_database_path(root_path):
+    # 每个仓库一个数据库
+    _digest = hashlib.sha1(os.path.normcase(os.path.abspath(root_path)).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(user_cache_dir(), f"vault-{_digest}.sqlite")
+
+
+class NoteHeading:
+    """索引中的一行标题，偏移为文件内的字节偏移（line_end_byte 指向行尾换行符）"""
+    __slots__ = ("line", "hashes", "spaced", "start_byte", "line_end_byte")
+
+    def __init__(self, line, hashes, spaced, start_byte, line_end_byte):
+        self.line = line
+        self.hashes = hashes
+        self.spaced = bool(spaced)
+        self.start_byte = start_byte
+        self.line_end_byte = line_end_byte
+
+
+class NoteOutline:
+    """
+    按章节读取笔记所需的索引信息：建立索引时的 mtime/大小、元数据结束处的字节偏移与全部标题。
+    lone_cr 表示文件中有不与 \n 相连的 \r，文本模式读取时它也是换行，标题的划分与索引不同。
+    """
+    __slots__ = ("mtime_ns", "size", "front_matter_end", "lone_cr", "headings")
+
+    def __init__(self, mtime_ns, size, front_matter_end, lone_cr, headings):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.front_matter_end = front_matter_end
+        self.lone_cr = bool(lone_cr)
+        self.headings = headings
+
+
+class VaultDatabase:
+    """
+    持久化在 SQLite 中的仓库索引：每篇笔记的路径、名称、mtime/大小、元数据区间、标题（含字节偏移）
+    以及出链和嵌入。sync() 按目录逐个 stat，只重新读取 mtime 或大小变化的文件。
+
+    路径在数据库中以相对仓库根目录、以 / 分隔的形式保存，对外接口使用绝对路径。
+    """
+
+    def __init__(self, root_path, database_path=None):
+        self.root_path = os.path.normpath(os.path.abspath(root_path))
+        self.database_path = database_path or default_database_path(self.root_path)
+        if self.database_path != ":memory:":
+            os.makedirs(os.path.dirname(self.database_path), exist_ok=True)
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(self.database_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._init_schema()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _init_schema(self):
+        with self._lock:
+            _version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+            if _version not in (0, SCHEMA_VERSION):
+                # 结构变化时直接重建，索引可以随时从仓库恢复
+                for _table in ("dirs", "notes", "headings", "links"):
+                    self._connection.execute(f"DROP TABLE IF EXISTS {_table}")
+            self._connection.executescript(_SCHEMA)
+            self._connection.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+            self._connection.commit()
+
+    def relative(self, path):
+        return os.path.relpath(os.path.abspath(path), self.root_path).replace(os.sep, "/")
+
+    def absolute(self, relative_path):
+        return os.path.normpath(os.path.join(self.root_path, relative_path))
+
+    # ---- 同步 ----
+
+    def sync(self, is_cancelled=None):
+        """
+        增量同步仓库，返回 (新增或修改的文件, 删除的文件)，均为绝对路径。
+        """
+        with self._lock:
+            _known = {_path: (_mtime, _size) for _path, _mtime, _size in
+                      self._connection.execute("SELECT path, mtime_ns, size FROM notes")}
+        _seen = set()
+        _changed = []
+        _dirs = {}
+        _stack = [self.root_path]
+        while _stack:
+            if is_cancelled is not None and is_cancelled():
+                return [], []
+            _dir = _stack.pop()
+            try:
+                _dirs[self.relative(_dir) if _dir != self.root_path else ""] = os.stat(_dir).st_mtime_ns
+                _entries = list(os.scandir(_dir))
+            except OSError:
+                continue
+            for _entry in _entries:
+                if _entry.name.startswith(".") or _entry.name in IGNORED_DIR_NAMES:
+                    continue
+                try:
+                    if _entry.is_dir():
+                        _stack.append(_entry.path)
+                        continue
+                    if not _entry.is_file():
+                        continue
+                    _stat = _entry.stat()
+                except OSError:
+                    continue
+                _relative = self.relative(_entry.path)
+                _seen.add(_relative)
+                if _known.get(_relative) != (_stat.st_mtime_ns, _stat.st_size):
+                    _changed.append((_relative, _stat.st_mtime_ns, _stat.st_size))
+
+        _removed = [_path for _path in _known if _path not in _seen]
+        with self._lock:
+            with self._connection:
+                for _path in _removed:
+                    self._delete_note(_path)
+        # 读取与解析在锁外进行，界面线程的 update_file() 等调用只需等待一批写入
+        for _start in range(0, len(_changed), SYNC_BATCH_NOTES):
+            if is_cancelled is not None and is_cancelled():
+                return [], []
+            _notes = [self._parse_note(*_note) for _note in _changed[_start:_start + SYNC_BATCH_NOTES]]
+            with self._lock:
+                with self._connection:
+                    for _note in _notes:
+                        self._write_note(_note)
+        with self._lock:
+            with self._connection:
+                self._connection.execute("DELETE FROM dirs")
+                self._connection.executemany("INSERT INTO dirs (path, mtime_ns) VALUES (?, ?)", _dirs.items())
+        return [self.absolute(_path) for _path, _, _ in _changed], [self.absolute(_path) for _path in _removed]
+
+    def update_file(self, path):
+        """单个文件变化后更新索引，文件已不存在时删除其记录"""
+        _relative = self.relative(path)
+        try:
+            _stat = os.stat(path)
+        except OSError:
+            with self._lock:
+                with self._connection:
+                    self._delete_note(_relative)
+            return
+        _note = self._parse_note(_relative, _stat.st_mtime_ns, _stat.st_size)
+        with self._lock:
+            with self._connection:
+                self._write_note(_note)
+
+    def _delete_note(self, relative_path):
+        self._connection.execute("DELETE FROM notes WHERE path = ?", (relative_path,))
+        self._connection.execute("DELETE FROM headings WHERE note = ?", (relative_path,))
+        self._connection.execute("DELETE FROM links WHERE note = ?", (relative_path,))
+
+    def _parse_note(self, relative_path, mtime_ns, size):
+        """读取并解析笔记，返回 (notes 行, headings 行, links 行)，不访问数据库"""
+        _dir, _, _name = relative_path.rpartition("/")
+        _front_matter_end_byte = 0
+        _lone_cr = 0
+        _headings = []
+        _links = []
+        if _name.lower().endswith(".md"):
+            # 按原始字节解码（不转换换行符），偏移与磁盘上的文件一致
+            try:
+                with open(self.absolute(relative_path), "rb") as f:
+                    _text = f.read().decode("utf-8")
+            except (OSError, UnicodeDecodeError):
+                _text = ""
+            _front_matter_end = len(_text) - len(strip_front_matter(_text))
+            _front_matter_end_byte = len(_text[:_front_matter_end].encode("utf-8"))
+            _headings = _heading_rows(relative_path, _text)
+            _lone_cr = 1 if _text.count("\r") != _text.count("\r\n") else 0
+            for _match in _LINK_PATTERN.finditer(_text):
+                _target, _, _section = _match.group(2).split("|", 1)[0].partition("#")
+                _links.append((relative_path, _target.strip(), _target.strip().lower(), _section,
+                               1 if _match.group(1) else 0))
+        return ((relative_path, _dir, _name, _name.lower(), mtime_ns, size, _front_matter_end_byte, _lone_cr),
+                _headings, _links)
+
+    def _write_note(self, note):
+        _row, _headings, _links = note
+        self._delete_note(_row[0])
+        self._connection.execute(
+            "INSERT INTO notes (path, dir, name, name_lower, mtime_ns, size, front_matter_end_byte, lone_cr)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", _row)
+        self._connection.executemany(
+            "INSERT INTO headings (note, ord, line, hashes, spaced, start_byte, line_end_byte)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)", _headings)
+        self._connection.executemany(
+            "INSERT INTO links (note, target, target_lower, section, is_embed) VALUES (?, ?, ?, ?, ?)", _links)
+
+    # ---- 查询 ----
+
+    def is_synced(self):
+        """是否完成过一次同步。目录表在 sync() 最后才写入，中途取消或崩溃的首次同步留下的部分笔记不可信"""
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM dirs LIMIT 1").fetchone() is not None
+
+    def files(self):
+        with self._lock:
+            return [self.absolute(_path) for _path, in self._connection.execute("SELECT path FROM notes")]
+
+    def dir_mtimes(self):
+        with self._lock:
+            return {self.absolute(_path): _mtime for _path, _mtime in
+                    self._connection.execute("SELECT path, mtime_ns FROM dirs")}
+
+    def note_outline(self, path):
+        """笔记的 NoteOutline，未被索引时返回 None"""
+        _relative = self.relative(path)
+        with self._lock:
+            _row = self._connection.execute(
+                "SELECT mtime_ns, size, front_matter_end_byte, lone_cr FROM notes WHERE path = ?",
+                (_relative,)).fetchone()
+            if _row is None:
+                return None
+            _headings = self._connection.execute(
+                "SELECT line, hashes, spaced, start_byte, line_end_byte FROM headings"
+                " WHERE note = ? ORDER BY ord", (_relative,)).fetchall()
+        return NoteOutline(*_row, [NoteHeading(*_heading) for _heading in _headings])
+
+    def notes_linking_to(self, name, embeds_only=True):
+        """链接目标名称（不区分大小写）为 name 的笔记"""
+        _name = name[:-3] if name.lower().endswith(".md") else name
+        with self._lock:
+            _rows = self._connection.execute(
+                "SELECT DISTINCT note FROM links WHERE (target_lower = ? OR target_lower = ? OR target_lower LIKE ?"
+                " ESCAPE '\\')" + (" AND is_embed = 1" if embeds_only else ""),
+                (_name.lower(), _name.lower() + ".md", "%/" + _like_escape(_name.lower()))).fetchall()
+        return [self.absolute(_row[0]) for _row in _rows]
+
+
+def _like_escape(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _heading_rows(relative_path, text):
+    _rows = []
+    _byte_pos = 0
+    _char_pos = 0
+    for _ord, _heading in enumerate(Outline(text).headings):
+        _byte_pos += len(text[_char_pos:_heading.start].encode("utf-8"))
+        _start_byte = _byte_pos
+        _byte_pos += len(text[_heading.start:_heading.line_end].encode("utf-8"))
+        _char_pos = _heading.line_end
+        _rows.append((relative_path, _ord, _heading.line.rstrip("\r"), _heading.hashes, 1 if _heading.spaced else 0,
+                      _start_byte, _byte_pos))
+    return _rows
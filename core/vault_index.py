@@ -0,0 +1,231 @@
+﻿import os
+import threading
+
+
+# Obsidian 内部目录，不参与索引
+IGNORED_DIR_NAMES = {".obsidian", ".trash", ".git"}
+
+
+class VaultIndex:
+    """
+    仓库内 文件名 -> 路径 的内存索引，用于 O(1) 解析 ![[embed]] 链接。
+
+    索引按小写文件名分组（Obsidian 链接大小写不敏感），同名文件保留全部路径，
+    解析时按 Obsidian 的规则挑选：路径后缀匹配 > 与来源笔记同目录 > 路径最短 > 大小写完全一致。
+    目录的 mtime 会被记录下来，refresh() 只重新扫描发生变化的目录。
+
+    界面线程 refresh() 的同时后台任务会查询索引，所有公开方法都在同一个可重入锁内执行。
+    """
+
+    def __init__(self, root_path=""):
+        self._lock = threading.RLock()
+        self._root_path = ""
+        self._by_name = {}
+        self._dir_mtimes = {}
+        self._dir_files = {}
+        # 可选的持久化索引（VaultDatabase），refresh() 发现的增删会同步写入
+        self.database = None
+        if root_path:
+            self.build(root_path)
+
+    @property
+    def root_path(self):
+        return self._root_path
+
+    def build(self, root_path):
+        with self._lock:
+            self._root_path = self._norm(root_path) if root_path else ""
+            self._by_name = {}
+            self._dir_mtimes = {}
+            self._dir_files = {}
+            if self._root_path and os.path.isdir(self._root_path):
+                self._scan_tree(self._root_path)
+
+    def load(self, root_path, files, dir_mtimes):
+        """
+        从持久化索引恢复而不遍历磁盘，之后调用 refresh() 即可补上关闭期间的增删
+        """
+        with self._lock:
+            self._root_path = self._norm(root_path)
+            self._by_name = {}
+            self._dir_mtimes = {self._norm(_dir): _mtime for _dir, _mtime in dir_mtimes.items()}
+            self._dir_files = {_dir: set() for _dir in self._dir_mtimes}
+            for _path in files:
+                self.add_file(_path)
+
+    def snapshot(self):
+        """返回 (files, dir_mtimes)，传给 load() 即可在其他进程中恢复同样的索引而不遍历磁盘"""
+        with self._lock:
+            return [_path for _paths in self._by_name.values() for _path in _paths], dict(self._dir_mtimes)
+
+    def files_under(self, dir_path):
+        """目录下（递归）的全部已索引文件，顺序与按名称排序的 os.walk 一致"""
+        dir_path = self._norm(dir_path)
+        _prefix = dir_path + os.sep
+        with self._lock:
+            # 目录按路径各级名称排序即为先序遍历顺序，只需排序目录，文件在各自目录内按名称排序
+            _dirs = sorted((_dir for _dir in self._dir_files if _dir == dir_path or _dir.startswith(_prefix)),
+                           key=lambda _dir: _dir[len(_prefix):].split(os.sep) if _dir != dir_path else [])
+            _files = []
+            for _dir in _dirs:
+                _files.extend(sorted(self._dir_files[_dir]))
+        return _files
+
+    def directories(self):
+        with self._lock:
+            return list(self._dir_mtimes)
+
+    def contains_dir(self, dir_path):
+        with self._lock:
+            return self._norm(dir_path) in self._dir_mtimes
+
+    def refresh(self):
+        """重新扫描 mtime 变化过的目录，返回是否有变化"""
+        with self._lock:
+            if not self._root_path:
+                return False
+            changed = False
+            for _dir in list(self._dir_mtimes):
+                if _dir not in self._dir_mtimes:
+                    # 已随父目录一同移除
+                    continue
+                try:
+                    _mtime = os.stat(_dir).st_mtime_ns
+                except OSError:
+                    self._drop_tree(_dir)
+                    changed = True
+                    continue
+                if _mtime != self._dir_mtimes[_dir]:
+                    self._rescan_dir(_dir)
+                    changed = True
+            return changed
+
+    def add_file(self, path):
+        path = self._norm(path)
+        with self._lock:
+            _paths = self._by_name.setdefault(os.path.basename(path).lower(), [])
+            if path not in _paths:
+                _paths.append(path)
+            self._dir_files.setdefault(os.path.dirname(path), set()).add(path)
+
+    def remove_file(self, path):
+        path = self._norm(path)
+        _key = os.path.basename(path).lower()
+        with self._lock:
+            _paths = self._by_name.get(_key)
+            if _paths and path in _paths:
+                _paths.remove(path)
+                if not _paths:
+                    del self._by_name[_key]
+            _files = self._dir_files.get(os.path.dirname(path))
+            if _files:
+                _files.discard(path)
+
+    def resolve(self, link, source_path=None):
+        """
+        将链接目标（如 "note"、"note.md"、"folder/note"）解析为绝对路径，找不到时返回 None
+        """
+        link = link.strip().replace("\\", "/")
+        if not link:
+            return None
+        link = link + ".md" if not link.lower().endswith(".md") else link
+        _name = link.rsplit("/", 1)[-1]
+        with self._lock:
+            # 复制一份，排序期间 refresh() 修改列表不影响结果
+            _candidates = list(self._by_name.get(_name.lower(), ()))
+        if not _candidates:
+            return None
+        if len(_candidates) == 1 and "/" not in link:
+            return _candidates[0]
+
+        if "/" in link:
+            # 带路径的链接：按仓库内相对路径的后缀匹配
+            _suffix = "/" + link.lstrip("/").lower()
+            _candidates = [_path for _path in _candidates
+                           if ("/" + self._relative(_path).lower()).endswith(_suffix)]
+            if not _candidates:
+                return None
+
+        _source_dir = self._norm(os.path.dirname(source_path)) if source_path else None
+
+        def _rank(_path):
+            return (
+                os.path.dirname(_path) != _source_dir,
+                self._relative(_path).count("/"),
+                os.path.basename(_path) != _name,
+                self._relative(_path).lower(),
+            )
+
+        return min(_candidates, key=_rank)
+
+    def _relative(self, path):
+        return os.path.relpath(path, self._root_path).replace(os.sep, "/")
+
+    def _scan_tree(self, dir_path):
+        _stack = [dir_path]
+        while _stack:
+            _dir = _stack.pop()
+            _sub_dirs = self._scan_dir(_dir)
+            if _sub_dirs is not None:
+                _stack.extend(_sub_dirs)
+
+    def _scan_dir(self, dir_path):
+        try:
+            _mtime = os.stat(dir_path).st_mtime_ns
+            _entries = list(os.scandir(dir_path))
+        except OSError:
+            return None
+        self._dir_mtimes[dir_path] = _mtime
+        self._dir_files[dir_path] = set()
+        _sub_dirs = []
+        for _entry in _entries:
+            if _entry.name.startswith(".") or _entry.name in IGNORED_DIR_NAMES:
+                continue
+            try:
+                if _entry.is_dir():
+                    _sub_dirs.append(self._norm(_entry.path))
+                elif _entry.is_file():
+                    self.add_file(_entry.path)
+            except OSError:
+                continue
+        return _sub_dirs
+
+    def _rescan_dir(self, dir_path):
+        _before = set(self._dir_files.get(dir_path, ()))
+        for _path in _before:
+            self.remove_file(_path)
+        _sub_dirs = self._scan_dir(dir_path)
+        if _sub_dirs is None:
+            self._drop_tree(dir_path)
+            self._sync_database(_before, set())
+            return
+        self._sync_database(_before, self._dir_files.get(dir_path, set()))
+        # 新增的子目录需要整体扫描，消失的子目录需要整体移除
+        _known = {_dir for _dir in self._dir_mtimes if os.path.dirname(_dir) == dir_path}
+        for _dir in _known - set(_sub_dirs):
+            self._drop_tree(_dir)
+        for _dir in set(_sub_dirs) - _known:
+            self._scan_tree(_dir)
+            if self.database is not None:
+                for _path in self.files_under(_dir):
+                    self.database.update_file(_path)
+
+    def _sync_database(self, before, after):
+        if self.database is None:
+            return
+        for _path in before.symmetric_difference(after):
+            self.database.update_file(_path)
+
+    def _drop_tree(self, dir_path):
+        _prefix = dir_path + os.sep
+        for _dir in [_d for _d in self._dir_mtimes if _d == dir_path or _d.startswith(_prefix)]:
+            for _path in list(self._dir_files.get(_dir, ())):
+                self.remove_file(_path)
+                if self.database is not None:
+                    self.database.update_file(_path)
+            self._dir_files.pop(_dir, None)
+            self._dir_mtimes.pop(_dir, None)
+
+    @staticmethod
+    def _norm(path):
+        return os.path.normpath(os.path.abspath(path))
@@ -0,0 +1,153 @@
+﻿import argparse
+import json
+import multiprocessing
+import os
+import sys
+
+from core.export import ExportJob, run_jobs, split_batch_jobs, BATCH_BY_NOTE, BATCH_BY_FOLDER
+from core.pipeline import collect_files
+from core.rules import ExportRules
+from core.selection import DEFAULT_EXTENSIONS, SelectionFilter
+from core.transclusion import DEFAULT_EMBED_DEPTH
+from core.vault_index import VaultIndex
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="无界面导出 Obsidian 笔记")
+    parser.add_argument("--vault", help="Obsidian 仓库根目录")
+    parser.add_argument("--select", nargs="+", default=[], help="相对仓库的文件或文件夹，缺省为整个仓库")
+    parser.add_argument("--include", action="append", default=[], help="仅包含的标题，可多次指定")
+    parser.add_argument("--exclude", action="append", default=[], help="不包含的标题，可多次指定")
+    parser.add_argument("--hide", action="append", default=[], help="隐藏的标题，可多次指定")
+    parser.add_argument("--hide-file-header", action="store_true", help="隐藏文件标题")
+    parser.add_argument("--hide-separator", action="store_true", help="隐藏分隔线")
+    parser.add_argument("--embed-depth", type=int, default=DEFAULT_EMBED_DEPTH, help="嵌入展开的最大层数")
+    parser.add_argument("--ext", action="append", default=[],
+                        help="展开文件夹时保留的扩展名，可多次指定，缺省为 .md；指定 * 表示不限")
+    parser.add_argument("--ignore", action="append", default=[], help=".gitignore 风格的忽略规则，可多次指定")
+    parser.add_argument("--ignore-file", help="从文件读取忽略规则（每行一条）")
+    parser.add_argument("-o", "--output", help="输出文件，按扩展名决定格式（.md/.docx/.html/...）")
+    parser.add_argument("--formats", nargs="+", default=[],
+                        help="同时导出的其他格式（如 html odt md），与 -o 同名，文档只解析一次")
+    parser.add_argument("--reference-doc", help="Word/ODT 样式模板")
+    parser.add_argument("--batch", choices=[BATCH_BY_NOTE, BATCH_BY_FOLDER],
+                        help="批量导出：每个笔记（note）或每个顶层文件夹（folder）一个文件，此时 -o 为输出目录")
+    parser.add_argument("--format", default=".docx", help="批量导出的输出扩展名，缺省为 .docx")
+    parser.add_argument("--manifest", help="JSON 任务清单，包含多个导出任务")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="并行进程数，缺省为 CPU 核数")
+    return parser
+
+
+def job_from_dict(job, base_dir="", defaults=None):
+    _job = dict(defaults or {})
+    _job.update(job)
+    _vault = os.path.join(base_dir, _job["vault"])
+    _select = _job.get("select", [])
+    _select = [_select] if isinstance(_select, str) else _select
+    _output = os.path.join(base_dir, _job["output"])
+    _reference_doc = _job.get("reference_doc")
+    return ExportJob(
+        vault=_vault,
+        select=tuple(_select),
+        output=_output,
+        extra_outputs=_extra_outputs(_output, _job.get("formats", ())),
+        reference_doc=os.path.join(base_dir, _reference_doc) if _reference_doc else None,
+        rules=ExportRules(
+            only_include=tuple(_job.get("include", ())),
+            only_exclude=tuple(_job.get("exclude", ())),
+            hide_header=tuple(_job.get("hide", ())),
+            hide_file_header=bool(_job.get("hide_file_header", False)),
+            hide_separator=bool(_job.get("hide_separator", False)),
+            embed_depth=int(_job.get("embed_depth", DEFAULT_EMBED_DEPTH)),
+        ),
+        selection_filter=SelectionFilter(
+            extensions=_extensions(_job.get("extensions") or DEFAULT_EXTENSIONS),
+            ignore_patterns=tuple(_job.get("ignore", ())),
+        ),
+    )
+
+
+def _extensions(extensions):
+    # "*" 表示不限扩展名，其余统一补上前导的点
+    extensions = [extensions] if isinstance(extensions, str) else extensions
+    if "*" in extensions:
+        return ()
+    return tuple(_ext if _ext.startswith(".") else "." + _ext for _ext in extensions)
+
+
+def _extra_outputs(output, formats):
+    # 与 output 同名、扩展名不同的输出文件
+    _base, _ext = os.path.splitext(output)
+    _exts = _extensions(formats) if formats else ()
+    return tuple(dict.fromkeys(_base + _e for _e in _exts if _e.lower() != _ext.lower()))
+
+
+def read_ignore_file(ignore_path):
+    with open(ignore_path, "r", encoding="utf-8") as f:
+        return [_line.rstrip("\n") for _line in f]
+
+
+def load_manifest(manifest_path):
+    """
+    任务清单格式：{"defaults": {...}, "jobs": [{"vault": ..., "select": [...], "output": ..., ...}]}，
+    也可以直接是任务列表。相对路径以清单所在目录为准。
+    """
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        _manifest = json.load(f)
+    if isinstance(_manifest, list):
+        _manifest = {"jobs": _manifest}
+    _base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    return [job_from_dict(_job, _base_dir, _manifest.get("defaults")) for _job in _manifest["jobs"]]
+
+
+def batch_jobs(job, vault_index, mode, extension):
+    # 以 job.output 为输出目录，把 job 的选择拆分为多个任务
+    extension = extension if extension.startswith(".") else "." + extension
+    files = collect_files(job.selected_paths(), vault_index, job.selection_filter)
+    return split_batch_jobs(files, job.vault, job.output, mode, job.rules, extension, job.reference_doc)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    vault_index = None
+    if args.manifest:
+        jobs = load_manifest(args.manifest)
+    elif args.vault and args.output:
+        jobs = [job_from_dict({
+            "vault": args.vault,
+            "select": args.select,
+            "output": args.output,
+            "include": args.include,
+            "exclude": args.exclude,
+            "hide": args.hide,
+            "hide_file_header": args.hide_file_header,
+            "hide_separator": args.hide_separator,
+            "embed_depth": args.embed_depth,
+            "extensions": args.ext,
+            "ignore": args.ignore + (read_ignore_file(args.ignore_file) if args.ignore_file else []),
+            "formats": args.formats,
+            "reference_doc": args.reference_doc,
+        })]
+        if args.batch:
+            # 拆分任务时建立的索引交给 run_jobs 复用，仓库只扫描一次
+            vault_index = VaultIndex(jobs[0].vault)
+            jobs = batch_jobs(jobs[0], vault_index, args.batch, args.format)
+    else:
+        parser.error("需要指定 --manifest，或同时指定 --vault 与 -o/--output")
+
+    def _report(job, result, error):
+        if error is not None:
+            print(f"失败 {job.output}: {error}", file=sys.stderr)
+        else:
+            print(f"完成 {result[0]}（{result[1]} 个文件）")
+
+    results = run_jobs(jobs, max_workers=args.jobs, on_result=_report, vault_index=vault_index)
+    return 1 if any(isinstance(_result, Exception) for _, _result in results) else 0
+
+
+if __name__ == "__main__":
+    # 打包后批量导出的进程池以 spawn 启动子进程，子进程需在此处转去执行任务
+    multiprocessing.freeze_support()
+    sys.exit(main())
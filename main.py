@@ -1,4 +1,5 @@
-﻿import os
+﻿import multiprocessing
+import os
 import sys
 
 from PySide6.QtCore import QCoreApplication
@@ -9,6 +10,8 @@ from windows.main_window import MainWindow
 
 
 if __name__ == "__main__":
+    # 打包后批量导出的进程池以 spawn 启动子进程，子进程需在此处转去执行任务而不是打开主窗口
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     QCoreApplication.setOrganizationName("Obsidian Exporter")
     QCoreApplication.setApplicationName("Obsidian Exporter")
@@ -0,0 +1,83 @@
+﻿import random
+
+import pytest
+
+from core.markdown_sections import extract_section, extract_section_regex, replace_section_title, \
+    replace_section_title_regex, include_sections, exclude_sections, hide_headings
+
+# 随机文档的组成行：标准标题、同名标题、不带空格的 #标签、空标题、标题文字出现在正文中等
+_LINES = [
+    "# A", "## A", "### A", "## A  ", "## B", "### B", "# C", "## Summary", "### Summary", "#tag", "#", "# ",
+    "##", "A", "Summary", "text", "中文 正文", "", "  ", "---", "- item", "## A#B", "A#B", "#A",
+]
+_TARGETS = ["## A", "A", "# A", "### B", "B", "Summary", "## Summary", "#", "# ", "A#B", "## A#B", "C", "X"]
+
+
+def _documents(count, seed=0):
+    _rng = random.Random(seed)
+    for _ in range(count):
+        _lines = [_rng.choice(_LINES) for _ in range(_rng.randint(0, 30))]
+        yield "\n".join(_lines) + _rng.choice(["", "\n", "\n\n"])
+
+
+def _rules(rng):
+    return rng.sample(_TARGETS, rng.randint(1, 4))
+
+
+def _include_regex(text, targets):
+    # 原先界面中的仅包含：逐条规则截取章节后拼接
+    _sections = [extract_section_regex(text, _target) for _target in targets]
+    _sections = [_section for _section in _sections if _section]
+    return "\n\n".join(_sections) if _sections else text
+
+
+def _hide_regex(text, targets):
+    for _target in targets:
+        text = replace_section_title_regex(text, _target, "")
+    return text
+
+
+def test_extract_section_matches_regex():
+    for _text in _documents(2000):
+        for _target in _TARGETS:
+            assert extract_section(_text, _target) == extract_section_regex(_text, _target), (_text, _target)
+
+
+def test_replace_section_title_matches_regex():
+    for _text in _documents(2000, seed=1):
+        for _target in _TARGETS:
+            assert replace_section_title(_text, _target, "") == replace_section_title_regex(_text, _target, ""), \
+                (_text, _target)
+            assert replace_section_title(_text, _target, "## New") == \
+                replace_section_title_regex(_text, _target, "## New"), (_text, _target)
+
+
+def test_include_sections_matches_regex():
+    _rng = random.Random(2)
+    for _text in _documents(2000, seed=2):
+        _targets = _rules(_rng)
+        assert include_sections(_text, _targets) == _include_regex(_text, _targets), (_text, _targets)
+
+
+def test_hide_headings_matches_regex():
+    _rng = random.Random(3)
+    for _text in _documents(2000, seed=3):
+        _targets = _rules(_rng)
+        assert hide_headings(_text, _targets) == _hide_regex(_text, _targets), (_text, _targets)
+
+
+@pytest.mark.parametrize("text, targets, expected", [
+    ("## A\nfoo\n## B\nbar\n", ["## A"], "## B\nbar\n"),
+    ("# T\n## A\nfoo\n## B\nbar\n## C\nbaz\n", ["## A", "C"], "# T\n## B\nbar\n"),
+    ("## A\nfoo\n", ["## X"], "## A\nfoo\n"),
+])
+def test_exclude_sections(text, targets, expected):
+    assert exclude_sections(text, targets) == expected
+
+
+def test_exclude_sections_removes_matched_spans_only():
+    # 有意的差异：原先对每个匹配章节做 str.replace，会删除所有逐字相同的副本；现在只删除规则匹配到的区间
+    _text = "## A\nfoo\n## B\nbar\n## A\nfoo\n"
+    _section = extract_section_regex(_text, "## A")
+    assert _text.replace(_section, "") == "## B\nbar\n"
+    assert exclude_sections(_text, ["## A"]) == "## B\nbar\n## A\nfoo\n"
@@ -0,0 +1,48 @@
+﻿from core.transclusion import TransclusionResolver
+from core.vault_index import VaultIndex
+
+
+def _vault(tmp_path, notes):
+    for _name, _text in notes.items():
+        (tmp_path / f"{_name}.md").write_text(_text, encoding="utf-8")
+    return VaultIndex(str(tmp_path))
+
+
+def _expand(resolver, tmp_path, name):
+    _path = tmp_path / f"{name}.md"
+    return resolver.expand(_path.read_text(encoding="utf-8"), str(_path))[0]
+
+
+def test_expands_nested_embeds_and_sections(tmp_path):
+    _index = _vault(tmp_path, {"A": "a ![[B]]", "B": "b ![[C#Part]]", "C": "# Other\nx\n# Part\nc\n"})
+    assert _expand(TransclusionResolver(_index), tmp_path, "A") == "a b # Part\nc\n"
+
+
+def test_depth_limit_leaves_deeper_embeds(tmp_path):
+    _index = _vault(tmp_path, {"A": "![[B]]", "B": "b ![[C]]", "C": "c ![[D]]", "D": "d"})
+    assert _expand(TransclusionResolver(_index, max_depth=1), tmp_path, "A") == "b ![[C]]"
+    assert _expand(TransclusionResolver(_index, max_depth=2), tmp_path, "A") == "b c ![[D]]"
+    assert _expand(TransclusionResolver(_index, max_depth=3), tmp_path, "A") == "b c d"
+
+
+def test_depth_limit_does_not_depend_on_render_order(tmp_path):
+    # C 先在较浅的位置展开过，之后在更深的位置仍需遵守层数限制
+    _index = _vault(tmp_path, {"F1": "![[B]]", "F2": "![[C]]", "B": "B says ![[C]]", "C": "C body"})
+    _alone = TransclusionResolver(_index, max_depth=1)
+    _shared = TransclusionResolver(_index, max_depth=1)
+    assert _expand(_shared, tmp_path, "F2") == "C body"
+    assert _expand(_shared, tmp_path, "F1") == _expand(_alone, tmp_path, "F1") == "B says ![[C]]"
+
+
+def test_cycles_are_left_unexpanded(tmp_path):
+    _index = _vault(tmp_path, {"A": "a ![[B]]", "B": "b ![[A]]", "S": "![[S]]"})
+    assert _expand(TransclusionResolver(_index), tmp_path, "A") == "a b ![[A]]"
+    assert _expand(TransclusionResolver(_index), tmp_path, "S") == "![[S]]"
+
+
+def test_cycle_detection_does_not_depend_on_render_order(tmp_path):
+    # 从 X 展开的 B 包含 A，复用到以 A 开头的嵌入链中会形成循环
+    _index = _vault(tmp_path, {"X": "![[B]]", "A": "a ![[B]]", "B": "b ![[A]]"})
+    _shared = TransclusionResolver(_index)
+    _expand(_shared, tmp_path, "X")
+    assert _expand(_shared, tmp_path, "A") == _expand(TransclusionResolver(_index), tmp_path, "A") == "a b ![[A]]"
@@ -0,0 +1,64 @@
+﻿import threading
+
+from PySide6.QtCore import QObject, QRunnable, Signal
+
+from core.export import run_jobs, split_batch_jobs
+from core.pipeline import collect_files
+
+
+class BatchExportSignals(QObject):
+    # done, total
+    progress = Signal(int, int)
+    # output path, message
+    job_failed = Signal(str, str)
+    # succeeded, failed
+    finished = Signal(int, int)
+    # message
+    failed = Signal(str)
+
+
+class BatchExportTask(QRunnable):
+    """
+    在 QThreadPool 中拆分选择并交给进程池并行导出，每个任务完成时报告进度，单个任务失败不影响其他任务。
+    """
+
+    def __init__(self, paths, rules, vault_index, output_dir, mode, selection_filter=None, extension=".docx",
+                 reference_doc=None):
+        super().__init__()
+        self.signals = BatchExportSignals()
+        self._paths = list(paths)
+        self._rules = rules
+        self._vault_index = vault_index
+        self._output_dir = output_dir
+        self._mode = mode
+        self._selection_filter = selection_filter
+        self._extension = extension
+        self._reference_doc = reference_doc
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def run(self):
+        _counts = {"done": 0, "failed": 0}
+        try:
+            files = collect_files(self._paths, self._vault_index, self._selection_filter)
+            jobs = split_batch_jobs(files, self._vault_index.root_path, self._output_dir, self._mode,
+                                    self._rules, self._extension, self._reference_doc)
+            self.signals.progress.emit(0, len(jobs))
+
+            def _on_result(job, result, error):
+                _counts["done"] += 1
+                if error is not None:
+                    _counts["failed"] += 1
+                    self.signals.job_failed.emit(job.output, str(error))
+                self.signals.progress.emit(_counts["done"], len(jobs))
+
+            run_jobs(jobs, on_result=_on_result, is_cancelled=self.is_cancelled, vault_index=self._vault_index)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.finished.emit(_counts["done"] - _counts["failed"], _counts["failed"])
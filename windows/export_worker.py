@@ -0,0 +1,68 @@
+﻿import threading
+
+from PySide6.QtCore import QObject, QRunnable, Signal
+
+from core.export import export_document, export_formats
+from core.pipeline import collect_files
+from core.profiling import NULL_PROFILE
+
+
+class ExportWorkerSignals(QObject):
+    # done, total
+    progress = Signal(int, int)
+    # output path
+    finished = Signal(str)
+    # message
+    failed = Signal(str)
+    cancelled = Signal()
+
+
+class ExportTask(QRunnable):
+    """
+    在 QThreadPool 中流式导出当前选择，不依赖预览内容。
+    传入 extra_outputs 时同一文档一次解析为 AST 后导出为多种格式；传入 profile（RunProfile）时记录各阶段耗时。
+    """
+
+    def __init__(self, paths, rules, vault_index, output_path, cache=None, selection_filter=None,
+                 reference_doc=None, extra_outputs=(), profile=NULL_PROFILE):
+        super().__init__()
+        self.signals = ExportWorkerSignals()
+        self._paths = list(paths)
+        self._rules = rules
+        self._vault_index = vault_index
+        self._output_path = output_path
+        self._cache = cache
+        self._selection_filter = selection_filter
+        self._reference_doc = reference_doc
+        self._extra_outputs = tuple(extra_outputs)
+        self.profile = profile
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def run(self):
+        try:
+            with self.profile.profiled():
+                with self.profile.stage("collect"):
+                    files = collect_files(self._paths, self._vault_index, self._selection_filter)
+                self.signals.progress.emit(0, len(files))
+                if self._extra_outputs:
+                    export_formats(files, self._rules, self._vault_index,
+                                   (self._output_path,) + self._extra_outputs, self._reference_doc,
+                                   cache=self._cache, on_progress=self.signals.progress.emit,
+                                   is_cancelled=self.is_cancelled, profile=self.profile)
+                else:
+                    export_document(files, self._rules, self._vault_index, self._output_path, cache=self._cache,
+                                    on_progress=self.signals.progress.emit, is_cancelled=self.is_cancelled,
+                                    reference_doc=self._reference_doc, profile=self.profile)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        if self.is_cancelled():
+            self.signals.cancelled.emit()
+        else:
+            self.signals.finished.emit(self._output_path)
@@ -1,19 +1,45 @@
 ﻿import os
-import re
+import sqlite3
 import subprocess
 import sys
 
-from PySide6.QtCore import Qt, QDir, QSettings, QFileInfo, QDirIterator, QCoreApplication
+from PySide6.QtCore import Qt, QSettings, QCoreApplication, QTimer, QThreadPool
 from PySide6.QtWidgets import QMainWindow, QVBoxLayout, QHBoxLayout, QSplitter, QLabel, QWidget, QPushButton, \
     QSizePolicy, QTreeWidget, QTextBrowser, QFileDialog, QTreeView, QFileSystemModel, QApplication, \
-    QListWidget, QListWidgetItem, QCheckBox, QMessageBox
-import pypandoc
+    QListWidget, QListWidgetItem, QCheckBox, QMessageBox, QProgressBar, QProgressDialog, \
+    QSpinBox, QLineEdit, QInputDialog, QComboBox
+
+from core.export import BATCH_BY_NOTE, BATCH_BY_FOLDER
+from core.fragment_cache import FragmentCache, DEFAULT_MAX_BYTES
+from core.pipeline import file_title
+from core.profiling import RunProfile, PROFILE_OFF, PROFILE_TRACE, PROFILE_CPROFILE
+from core.rules import ExportRules
+from core.selection import DEFAULT_EXTENSIONS, SelectionFilter
+from core.transclusion import DEFAULT_EMBED_DEPTH
+from core.vault_db import VaultDatabase, user_cache_dir
+from core.vault_index import VaultIndex
+from windows.batch_export_worker import BatchExportTask
+from windows.export_worker import ExportTask
+from windows.preview_document import PreviewDocument
+from windows.preview_worker import PreviewRenderTask
+from windows.profile_dialog import ProfileDialog
+from windows.vault_watcher import VaultWatcher
+from windows.vault_worker import VaultSyncTask
+
+# 规则编辑、勾选框切换等连续触发时，等待这么久没有新的修改才开始渲染
+PREVIEW_DEBOUNCE_MS = 200
+# 预览每次渲染的文件数，滚动到底部/顶部或从目录跳转时再渲染下一页
+PREVIEW_PAGE_FILES = 20
+# 预览文档中最多保留的文件数，超出时丢弃远离视口一端的文件
+PREVIEW_MAX_LOADED_FILES = 60
+# 页面渲染完成后插入预览文档的方式
+PREVIEW_RESET = "reset"
+PREVIEW_APPEND = "append"
+PREVIEW_PREPEND = "prepend"
+# 性能记录选项，开启跟踪时文件写入用户缓存目录
+PROFILE_MODES = {"关闭": PROFILE_OFF, "Chrome 跟踪": PROFILE_TRACE, "cProfile": PROFILE_CPROFILE}
+PROFILE_OUTPUT_DIR = os.path.join(user_cache_dir(), "traces")
 
-if hasattr(sys, '_MEIPASS'):
-    # PyInstaller 在打包后，_MEIPASS 指向临时解压/运行目录
-    base_path = sys._MEIPASS
-    pandoc_path = os.path.join(base_path, 'pandoc/pandoc')
-    pypandoc.__pandoc_path = pandoc_path
 
 class MainWindow(QMainWindow):
 
@@ -23,6 +49,18 @@ class MainWindow(QMainWindow):
         self.setMinimumSize(400, 300)
 
         self.__selected_selected_files = []
+        self.__export_tasks = []
+        # 最近一次预览刷新或导出的分阶段计时
+        self.__last_profile = None
+        self._vault_index = VaultIndex()
+        self._vault_database = None
+        self.__vault_sync_task = None
+        # 预览文档中已加载的文件，仓库变化只有涉及它们时才重新渲染
+        self.__preview_files = set()
+        self._vault_watcher = VaultWatcher(self)
+        self._vault_watcher.changed.connect(self.__on_vault_changed)
+        self._fragment_cache = FragmentCache(
+            int(QSettings().value("fragment_cache_mb", DEFAULT_MAX_BYTES // (1024 * 1024))) * 1024 * 1024)
 
         self.__init_layout()
         self.__init_button_bar()
@@ -43,12 +81,23 @@ class MainWindow(QMainWindow):
                              [self._only_exclude_list.item(i).text() for i in range(self._only_exclude_list.count())])
         QSettings().setValue("hide_header_list",
                              [self.hide_header_list.item(i).text() for i in range(self.hide_header_list.count())])
+        QSettings().setValue("ignore_list",
+                             [self.ignore_list.item(i).text() for i in range(self.ignore_list.count())])
+        QSettings().setValue("file_extensions", self.file_extensions.text())
         QSettings().setValue("hide_file_header", self.hide_file_header.isChecked())
         QSettings().setValue("hide_separator", self.hide_separator.isChecked())
-        event.accept()
-
-    def focusInEvent(self, event):
-        self.__refresh_preview()
+        QSettings().setValue("live_preview", self.live_preview.isChecked())
+        QSettings().setValue("embed_depth", self.embed_depth.value())
+        QSettings().setValue("reference_doc", self.reference_doc.text())
+        QSettings().setValue("profile_mode", self.profile_mode.currentData())
+        # 停止后台同步并关闭数据库；close() 会等待正在写入的一批完成
+        if self.__vault_sync_task is not None:
+            self.__vault_sync_task.cancel()
+            self.__vault_sync_task = None
+        if self._vault_database is not None:
+            self._vault_index.database = None
+            self._vault_database.close()
+            self._vault_database = None
         event.accept()
 
     def __restore_settings(self):
@@ -69,15 +118,35 @@ class MainWindow(QMainWindow):
                 _widget_item = QListWidgetItem(_item)
                 _widget_item.setFlags(_widget_item.flags() | Qt.ItemFlag.ItemIsEditable)
                 self.hide_header_list.addItem(_widget_item)
+        if QSettings().contains("ignore_list"):
+            for _item in QSettings().value("ignore_list"):
+                _widget_item = QListWidgetItem(_item)
+                _widget_item.setFlags(_widget_item.flags() | Qt.ItemFlag.ItemIsEditable)
+                self.ignore_list.addItem(_widget_item)
+        if QSettings().contains("file_extensions"):
+            self.file_extensions.setText(QSettings().value("file_extensions"))
         if QSettings().contains("hide_file_header"):
             self.hide_file_header.setChecked(True if QSettings().value("hide_file_header") == "true" else False)
         if QSettings().contains("hide_separator"):
             self.hide_separator.setChecked(True if QSettings().value("hide_separator") == "true" else False)
+        if QSettings().contains("embed_depth"):
+            self.embed_depth.setValue(int(QSettings().value("embed_depth")))
+        if QSettings().contains("reference_doc"):
+            self.reference_doc.setText(QSettings().value("reference_doc"))
+        if QSettings().contains("profile_mode"):
+            _index = self.profile_mode.findData(QSettings().value("profile_mode"))
+            if _index >= 0:
+                self.profile_mode.setCurrentIndex(_index)
+        if QSettings().contains("live_preview"):
+            self.live_preview.setChecked(True if QSettings().value("live_preview") == "true" else False)
 
     def __connect_signals(self):
         self._open_depo_button.clicked.connect(self.__open_depo)
         self._export_word_button.clicked.connect(self.__export_word)
         self._export_markdown_button.clicked.connect(self.__export_markdown)
+        self._batch_export_button.clicked.connect(self.__batch_export_word)
+        self._multi_export_button.clicked.connect(self.__export_multiple_formats)
+        self.reference_doc_button.clicked.connect(self.__choose_reference_doc)
         self._file_tree_view.clicked.connect(self.__update_selected_files)
         self._file_tree_model.rootPathChanged.connect(self.preview.setMarkdown(""))
         self.only_include_list.itemChanged.connect(self.__refresh_preview)
@@ -89,8 +158,17 @@ class MainWindow(QMainWindow):
         self.hide_header_list.itemChanged.connect(self.__refresh_preview)
         self.hide_header_list_add_button.clicked.connect(self.__add_hide_header)
         self.hide_header_list_remove_button.clicked.connect(self.__remove_hide_header)
+        self.ignore_list.itemChanged.connect(self.__refresh_preview)
+        self.ignore_list_add_button.clicked.connect(self.__add_ignore)
+        self.ignore_list_remove_button.clicked.connect(self.__remove_ignore)
+        self.file_extensions.editingFinished.connect(self.__refresh_preview)
         self.hide_file_header.stateChanged.connect(self.__refresh_preview)
         self.hide_separator.stateChanged.connect(self.__refresh_preview)
+        self.embed_depth.valueChanged.connect(self.__refresh_preview)
+        self.live_preview.stateChanged.connect(self.__toggle_live_preview)
+        self.preview.verticalScrollBar().valueChanged.connect(self.__on_preview_scrolled)
+        self.preview_toc.itemClicked.connect(self.__on_preview_toc_clicked)
+        self.profile_details_button.clicked.connect(self.__show_profile_details)
 
     def __init_layout(self):
         self.main_widget = QWidget()
@@ -138,6 +216,12 @@ class MainWindow(QMainWindow):
         self._export_markdown_button = QPushButton("导出 Markdown")
         self.button_bar_layout.addWidget(self._export_markdown_button)
 
+        self._batch_export_button = QPushButton("批量导出 Word")
+        self.button_bar_layout.addWidget(self._batch_export_button)
+
+        self._multi_export_button = QPushButton("导出多种格式")
+        self.button_bar_layout.addWidget(self._multi_export_button)
+
     def __init_file_tree(self):
         self._file_tree_model = QFileSystemModel()
 
@@ -158,10 +242,34 @@ class MainWindow(QMainWindow):
         if QSettings().contains("last_root_path"):
             self._file_tree_model.setRootPath(QSettings().value("last_root_path"))
             self._file_tree_view.setRootIndex(self._file_tree_model.index(QSettings().value("last_root_path")))
+            self.__load_vault(QSettings().value("last_root_path"))
 
     def __init_preview(self):
+        self.preview_splitter = QSplitter()
+        self.preview_splitter.setChildrenCollapsible(False)
+        self.preview_layout.addWidget(self.preview_splitter)
+        # 选中文件的目录，点击跳转到对应文件
+        self.preview_toc = QListWidget()
+        self.preview_splitter.addWidget(self.preview_toc)
         self.preview = QTextBrowser()
-        self.preview_layout.addWidget(self.preview)
+        self.preview_splitter.addWidget(self.preview)
+        self.preview_splitter.setStretchFactor(1, 1)
+        self.preview_document = PreviewDocument(self.preview)
+        self.preview_progress = QProgressBar()
+        self.preview_progress.setFormat("正在生成预览 %v/%m")
+        self.preview_progress.hide()
+        self.preview_layout.addWidget(self.preview_progress)
+
+        self.__preview_generation = 0
+        self.__preview_task = None
+        # 选择展开后的全部文件，以及预览文档中第一个文件在其中的下标
+        self.__preview_all_files = []
+        self.__preview_start = 0
+        self.__preview_jump_to = None
+        self.__preview_debounce_timer = QTimer(self)
+        self.__preview_debounce_timer.setSingleShot(True)
+        self.__preview_debounce_timer.setInterval(PREVIEW_DEBOUNCE_MS)
+        self.__preview_debounce_timer.timeout.connect(self.__start_preview_render)
 
     def __init_config(self):
         self.only_include = QLabel("仅包含以下标题的内容：")
@@ -198,10 +306,58 @@ class MainWindow(QMainWindow):
         self.hide_header_list_remove_button = QPushButton("移除")
         self.hide_header_list_button_group_layout.addWidget(self.hide_header_list_remove_button)
 
+        self.ignore = QLabel("忽略以下文件或文件夹（.gitignore 规则）：")
+        self.config_layout.addWidget(self.ignore)
+        self.ignore_list = QListWidget()
+        self.config_layout.addWidget(self.ignore_list)
+        self.ignore_list_button_group_layout = QHBoxLayout()
+        self.config_layout.addLayout(self.ignore_list_button_group_layout)
+        self.ignore_list_add_button = QPushButton("添加")
+        self.ignore_list_button_group_layout.addWidget(self.ignore_list_add_button)
+        self.ignore_list_remove_button = QPushButton("移除")
+        self.ignore_list_button_group_layout.addWidget(self.ignore_list_remove_button)
+        self.file_extensions_layout = QHBoxLayout()
+        self.config_layout.addLayout(self.file_extensions_layout)
+        self.file_extensions_layout.addWidget(QLabel("文件类型："))
+        self.file_extensions = QLineEdit(" ".join(DEFAULT_EXTENSIONS))
+        self.file_extensions.setPlaceholderText("以空格分隔，如 .md .txt；留空表示不限")
+        self.file_extensions_layout.addWidget(self.file_extensions)
+
         self.hide_file_header = QCheckBox("隐藏文件标题")
         self.config_layout.addWidget(self.hide_file_header)
         self.hide_separator = QCheckBox("隐藏分隔线")
         self.config_layout.addWidget(self.hide_separator)
+        self.embed_depth_layout = QHBoxLayout()
+        self.config_layout.addLayout(self.embed_depth_layout)
+        self.embed_depth_layout.addWidget(QLabel("嵌入展开层数："))
+        self.embed_depth = QSpinBox()
+        self.embed_depth.setRange(0, 20)
+        self.embed_depth.setValue(DEFAULT_EMBED_DEPTH)
+        self.embed_depth_layout.addWidget(self.embed_depth)
+        self.reference_doc_layout = QHBoxLayout()
+        self.config_layout.addLayout(self.reference_doc_layout)
+        self.reference_doc_layout.addWidget(QLabel("Word 模板："))
+        self.reference_doc = QLineEdit()
+        self.reference_doc.setPlaceholderText("留空使用 pandoc 默认样式")
+        self.reference_doc_layout.addWidget(self.reference_doc)
+        self.reference_doc_button = QPushButton("选择")
+        self.reference_doc_layout.addWidget(self.reference_doc_button)
+        self.live_preview = QCheckBox("实时预览")
+        self.live_preview.setChecked(True)
+        self.config_layout.addWidget(self.live_preview)
+        self.profile_mode_layout = QHBoxLayout()
+        self.config_layout.addLayout(self.profile_mode_layout)
+        self.profile_mode_layout.addWidget(QLabel("性能记录："))
+        self.profile_mode = QComboBox()
+        for _label, _mode in PROFILE_MODES.items():
+            self.profile_mode.addItem(_label, _mode)
+        self.profile_mode.setToolTip(f"开启后每次预览和导出的跟踪文件保存到 {PROFILE_OUTPUT_DIR}")
+        self.profile_mode_layout.addWidget(self.profile_mode)
+        self.profile_details_button = QPushButton("性能详情")
+        self.profile_mode_layout.addWidget(self.profile_details_button)
+        # 最近一次运行的耗时摘要
+        self.profile_summary = QLabel()
+        self.statusBar().addPermanentWidget(self.profile_summary)
 
     def __open_depo(self):
         __dir_dialog = QFileDialog(self, "选择 Obsidian 仓库文件夹")
@@ -212,11 +368,90 @@ class MainWindow(QMainWindow):
             if __selected_dir:
                 root_path = __selected_dir[0]
                 QSettings().setValue("last_root_path", root_path)
+                self.__load_vault(root_path)
                 if self._file_tree_model.setRootPath(root_path):
                     root_index = self._file_tree_model.index(root_path)
                     if root_index.isValid():
                         self._file_tree_view.setRootIndex(root_index)
 
+    def __load_vault(self, root_path):
+        # 先从持久化索引恢复（不遍历磁盘），再在后台按 mtime/大小增量同步
+        if self.__vault_sync_task is not None:
+            self.__vault_sync_task.cancel()
+            self.__vault_sync_task = None
+        if self._vault_database is not None:
+            self._vault_index.database = None
+            self._vault_database.close()
+            self._vault_database = None
+        try:
+            self._vault_database = VaultDatabase(root_path)
+        except (OSError, sqlite3.Error):
+            self._vault_index.build(root_path)
+            self._vault_watcher.clear()
+            self._vault_watcher.watch_directories(self._vault_index.directories())
+            return
+
+        if not self._vault_database.is_synced():
+            self._vault_index.build(root_path)
+        else:
+            self._vault_index.load(root_path, self._vault_database.files(), self._vault_database.dir_mtimes())
+            self._vault_index.refresh()
+        self._vault_watcher.clear()
+        self._vault_watcher.watch_directories(self._vault_index.directories())
+
+        self.__vault_sync_task = VaultSyncTask(self._vault_database)
+        self.__vault_sync_task.signals.finished.connect(self.__on_vault_synced)
+        self.__vault_sync_task.signals.failed.connect(self.__on_vault_sync_failed)
+        QThreadPool.globalInstance().start(self.__vault_sync_task)
+
+    def __on_vault_synced(self, changed, removed):
+        self.__vault_sync_task = None
+        # 以同步后的数据库为准重新加载内存索引，再补上同步期间的增删
+        self._vault_index.load(self._vault_database.root_path, self._vault_database.files(),
+                               self._vault_database.dir_mtimes())
+        self._vault_index.refresh()
+        self._vault_watcher.watch_directories(self._vault_index.directories())
+        self._vault_index.database = self._vault_database
+        self.statusBar().showMessage(f"仓库索引已更新：{len(changed)} 个文件变化，{len(removed)} 个文件删除", 5000)
+
+    def __on_vault_sync_failed(self, message):
+        # 内存索引仍可用，只是不使用持久化索引（按章节读取、嵌入关系）
+        self.__vault_sync_task = None
+        self.statusBar().showMessage(f"仓库索引同步失败：{message}", 5000)
+
+    def __on_vault_changed(self, dirs, files):
+        _selection_changed = False
+        if dirs:
+            # 目录内容变化：更新索引并监视新出现的子目录
+            _before = set(self._vault_index.directories())
+            self._vault_index.refresh()
+            self._vault_watcher.watch_directories(self._vault_index.directories())
+            _selected_paths = [os.path.normpath(self._file_tree_model.filePath(_item))
+                               for _item in self.__selected_selected_files]
+            for _dir in set(dirs) | (_before ^ set(self._vault_index.directories())):
+                # 选中的文件夹内增删了文件
+                if any(_dir == _path or _dir.startswith(_path + os.sep) for _path in _selected_paths):
+                    _selection_changed = True
+        if self._vault_database is not None:
+            for _file in files:
+                self._vault_database.update_file(_file)
+
+        # 被修改的文件本身以及（逐层）嵌入了它们的笔记：缓存中的片段记录了依赖，
+        # 不在缓存中的笔记由持久化索引的嵌入关系查出
+        _affected = set(files)
+        for _file in files:
+            _affected |= self._fragment_cache.dependents(_file)
+            self._fragment_cache.invalidate(_file)
+        if self._vault_database is not None:
+            _pending = list(files)
+            while _pending:
+                for _note in self._vault_database.notes_linking_to(os.path.basename(_pending.pop())):
+                    if _note not in _affected:
+                        _affected.add(_note)
+                        _pending.append(_note)
+        if _selection_changed or _affected & self.__preview_files:
+            self.__refresh_preview()
+
     def __update_selected_files(self, index):
         cur_selected = self._file_tree_view.selectedIndexes()
 
@@ -230,6 +465,8 @@ class MainWindow(QMainWindow):
         if index not in self.__selected_selected_files:
             self.__selected_selected_files.append(index)
 
+        # 选择变化后预览从第一个文件开始
+        self.__preview_start = 0
         self.__refresh_preview()
 
     def __add_include(self):
@@ -265,176 +502,349 @@ class MainWindow(QMainWindow):
             self.hide_header_list.takeItem(self.hide_header_list.row(_item))
         self.__refresh_preview()
 
+    def __add_ignore(self):
+        _widget_item = QListWidgetItem("*.pdf")
+        _widget_item.setFlags(_widget_item.flags() | Qt.ItemFlag.ItemIsEditable)
+        self.ignore_list.addItem(_widget_item)
+        self.__refresh_preview()
+
+    def __remove_ignore(self):
+        for _item in self.ignore_list.selectedItems():
+            self.ignore_list.takeItem(self.ignore_list.row(_item))
+        self.__refresh_preview()
+
     def __export_word(self):
         _saved_file, _ = QFileDialog(self, "选择导出 Word 的位置").getSaveFileName()
         if _saved_file:
             if not _saved_file.endswith(".docx"):
                 _saved_file += ".docx"
-            if convert_markdown_to_word(self.preview.toMarkdown(), _saved_file):
-                if QMessageBox.information(self, "导出 Word", "导出 Word 成功！是否打开？",
-                                           QMessageBox.StandardButton.Yes,
-                                           QMessageBox.StandardButton.No) == QMessageBox.StandardButton.Yes:
-                    if sys.platform == "win32":
-                        os.startfile(_saved_file)
-                    else:
-                        opener = "open" if sys.platform == "darwin" else "xdg-open"
-                        subprocess.call([opener, _saved_file])
+            self.__start_export(_saved_file, "导出 Word")
 
     def __export_markdown(self):
         _saved_file, _ = QFileDialog(self, "选择导出 Markdown 的位置").getSaveFileName()
         if _saved_file:
             if not _saved_file.endswith(".md"):
                 _saved_file += ".md"
-            if save_markdown_file(self.preview.toMarkdown(), _saved_file):
-                if QMessageBox.information(self, "导出 Markdown", "导出 Markdown 成功！是否打开？",
-                                           QMessageBox.StandardButton.Yes,
-                                           QMessageBox.StandardButton.No) == QMessageBox.StandardButton.Yes:
-                    if sys.platform == "win32":
-                        os.startfile(_saved_file)
-                    else:
-                        opener = "open" if sys.platform == "darwin" else "xdg-open"
-                        subprocess.call([opener, _saved_file])
-
-    def __refresh_preview(self):
-        files = []
-
-        for _item in self.__selected_selected_files:
-            _file_path = self._file_tree_model.filePath(_item)
-            if QFileInfo(_file_path).isDir():
-                f_dir = QDir(_file_path)
-                it = QDirIterator(f_dir, QDirIterator.IteratorFlag.Subdirectories)
-                while it.hasNext():
-                    _file = it.next()
-                    if QFileInfo(_file).isFile():
-                        if _file not in files:
-                            files.append(_file)
+            self.__start_export(_saved_file, "导出 Markdown")
+
+    def __export_multiple_formats(self):
+        _saved_file, _ = QFileDialog(self, "选择导出的位置（文件名不含扩展名）").getSaveFileName()
+        if not _saved_file:
+            return
+        _formats, _ok = QInputDialog.getText(self, "导出多种格式", "导出格式（以空格分隔）：",
+                                             text=QSettings().value("export_formats", "docx html odt md"))
+        _formats = [_format.lstrip(".") for _format in _formats.replace(",", " ").split()]
+        if not _ok or not _formats:
+            return
+        QSettings().setValue("export_formats", " ".join(_formats))
+        _base = os.path.splitext(_saved_file)[0]
+        _outputs = list(dict.fromkeys(f"{_base}.{_format}" for _format in _formats))
+        self.__start_export(_outputs[0], "导出多种格式", _outputs[1:])
+
+    def __choose_reference_doc(self):
+        _file, _ = QFileDialog.getOpenFileName(self, "选择 Word 模板", "", "Word/ODT 文档 (*.docx *.odt)")
+        if _file:
+            self.reference_doc.setText(_file)
+
+    def __start_export(self, output_path, title, extra_outputs=()):
+        # 直接从源文件流式导出，不经过预览
+        _paths = [self._file_tree_model.filePath(_item) for _item in self.__selected_selected_files]
+        self._vault_index.refresh()
+        _profile = self.__new_profile(title)
+        _task = ExportTask(_paths, self.__current_rules(), self._vault_index, output_path, self._fragment_cache,
+                           self.__current_selection_filter(), self.reference_doc.text() or None, extra_outputs,
+                           _profile)
+        # 先于结果对话框连接，弹出对话框前耗时摘要已更新
+        _task.signals.finished.connect(lambda *_: self.__on_run_profiled(_profile))
+        _task.signals.failed.connect(lambda *_: self.__on_run_profiled(_profile))
+        _task.signals.cancelled.connect(lambda *_: self.__on_run_profiled(_profile))
+
+        _progress_dialog = QProgressDialog(f"正在{title}…", "取消", 0, 0, self)
+        _progress_dialog.setWindowTitle(title)
+        _progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        _progress_dialog.setMinimumDuration(300)
+        _progress_dialog.canceled.connect(_task.cancel)
+        _task.signals.progress.connect(lambda done, total: (_progress_dialog.setMaximum(total),
+                                                            _progress_dialog.setValue(done)))
+        _task.signals.finished.connect(lambda path: self.__on_export_finished(_progress_dialog, title, path))
+        _task.signals.failed.connect(lambda message: self.__on_export_failed(_progress_dialog, title, message))
+        _task.signals.cancelled.connect(_progress_dialog.close)
+
+        self.__export_tasks.append(_task)
+        _task.signals.finished.connect(lambda *_: self.__export_tasks.remove(_task))
+        _task.signals.failed.connect(lambda *_: self.__export_tasks.remove(_task))
+        _task.signals.cancelled.connect(lambda *_: self.__export_tasks.remove(_task))
+        QThreadPool.globalInstance().start(_task)
+
+    def __on_export_finished(self, progress_dialog, title, output_path):
+        progress_dialog.close()
+        if QMessageBox.information(self, title, f"{title}成功！是否打开？",
+                                   QMessageBox.StandardButton.Yes,
+                                   QMessageBox.StandardButton.No) == QMessageBox.StandardButton.Yes:
+            if sys.platform == "win32":
+                os.startfile(output_path)
+            else:
+                opener = "open" if sys.platform == "darwin" else "xdg-open"
+                subprocess.call([opener, output_path])
+
+    def __on_export_failed(self, progress_dialog, title, message):
+        progress_dialog.close()
+        QMessageBox.warning(self, title, f"{title}失败：{message}")
+
+    def __batch_export_word(self):
+        _output_dir = QFileDialog.getExistingDirectory(self, "选择批量导出的目录")
+        if not _output_dir:
+            return
+        _modes = {"每个笔记一个文件": BATCH_BY_NOTE, "每个顶层文件夹一个文件": BATCH_BY_FOLDER}
+        _mode, _ok = QInputDialog.getItem(self, "批量导出 Word", "拆分方式：", list(_modes), 0, False)
+        if not _ok:
+            return
+        _title = "批量导出 Word"
+        _paths = [self._file_tree_model.filePath(_item) for _item in self.__selected_selected_files]
+        self._vault_index.refresh()
+        _task = BatchExportTask(_paths, self.__current_rules(), self._vault_index, _output_dir, _modes[_mode],
+                                self.__current_selection_filter(), reference_doc=self.reference_doc.text() or None)
+
+        _progress_dialog = QProgressDialog(f"正在{_title}…", "取消", 0, 0, self)
+        _progress_dialog.setWindowTitle(_title)
+        _progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        _progress_dialog.setMinimumDuration(300)
+        _progress_dialog.canceled.connect(_task.cancel)
+        _task.signals.progress.connect(lambda done, total: (_progress_dialog.setMaximum(total),
+                                                            _progress_dialog.setValue(done),
+                                                            _progress_dialog.setLabelText(
+                                                                f"正在{_title}… {done}/{total}")))
+        _errors = []
+        _task.signals.job_failed.connect(lambda path, message: _errors.append(f"{path}：{message}"))
+        _task.signals.finished.connect(lambda succeeded, failed: self.__on_batch_export_finished(
+            _progress_dialog, _title, _output_dir, succeeded, _errors))
+        _task.signals.failed.connect(lambda message: self.__on_export_failed(_progress_dialog, _title, message))
+
+        self.__export_tasks.append(_task)
+        _task.signals.finished.connect(lambda *_: self.__export_tasks.remove(_task))
+        _task.signals.failed.connect(lambda *_: self.__export_tasks.remove(_task))
+        QThreadPool.globalInstance().start(_task)
+
+    def __on_batch_export_finished(self, progress_dialog, title, output_dir, succeeded, errors):
+        progress_dialog.close()
+        if errors:
+            _message_box = QMessageBox(QMessageBox.Icon.Warning, title,
+                                       f"已导出 {succeeded} 个文件，{len(errors)} 个失败。", parent=self)
+            _message_box.setDetailedText("\n".join(errors))
+            _message_box.exec()
+            return
+        if QMessageBox.information(self, title, f"已导出 {succeeded} 个文件，是否打开目录？",
+                                   QMessageBox.StandardButton.Yes,
+                                   QMessageBox.StandardButton.No) == QMessageBox.StandardButton.Yes:
+            if sys.platform == "win32":
+                os.startfile(output_dir)
             else:
-                if _file_path not in files:
-                    files.append(_file_path)
+                opener = "open" if sys.platform == "darwin" else "xdg-open"
+                subprocess.call([opener, output_dir])
 
-        content = "---\n\n---\n\n"
+    def __refresh_preview(self):
+        if not self.live_preview.isChecked():
+            return
+        # 连续的修改只触发一次渲染
+        self.__preview_debounce_timer.start()
+
+    def __toggle_live_preview(self, state):
+        if self.live_preview.isChecked():
+            self.__refresh_preview()
+        else:
+            # 关闭预览时放弃正在进行的渲染并释放预览文档
+            self.__preview_debounce_timer.stop()
+            if self.__preview_task is not None:
+                self.__preview_task.cancel()
+                self.__preview_task = None
+            self.__preview_generation += 1
+            self.preview_progress.hide()
+            self.preview_document.clear()
+            self.preview_toc.clear()
+            self.__preview_all_files = []
+            self.__preview_files = set()
+
+    def __start_preview_render(self):
+        if self.__preview_task is not None:
+            self.__preview_task.cancel()
+
+        _paths = [self._file_tree_model.filePath(_item) for _item in self.__selected_selected_files]
+
+        # 文件可能在上次刷新后增删，只重扫变化过的目录
+        self._vault_index.refresh()
+
+        # 重新展开选择并渲染已加载的范围（未变化的文件直接命中缓存），完整文档只在导出时生成
+        self.__preview_generation += 1
+        self.__preview_task = PreviewRenderTask(self.__preview_generation, _paths, self.__current_rules(),
+                                                self._vault_index, self._fragment_cache,
+                                                self.__current_selection_filter(),
+                                                start=self.__preview_start,
+                                                count=max(PREVIEW_PAGE_FILES, len(self.preview_document)),
+                                                profile=self.__new_profile("预览"))
+        self.__connect_preview_task(self.__preview_task, PREVIEW_RESET)
+        QThreadPool.globalInstance().start(self.__preview_task)
+
+    def __current_rules(self):
+        return ExportRules(
+            only_include=tuple(self.only_include_list.item(i).text() for i in range(self.only_include_list.count())),
+            only_exclude=tuple(self._only_exclude_list.item(i).text() for i in range(self._only_exclude_list.count())),
+            hide_header=tuple(self.hide_header_list.item(i).text() for i in range(self.hide_header_list.count())),
+            hide_file_header=self.hide_file_header.isChecked(),
+            hide_separator=self.hide_separator.isChecked(),
+            embed_depth=self.embed_depth.value(),
+        )
+
+    def __current_selection_filter(self):
+        _extensions = self.file_extensions.text().replace(",", " ").split()
+        return SelectionFilter(
+            extensions=tuple(_ext if _ext.startswith(".") else "." + _ext for _ext in _extensions),
+            ignore_patterns=tuple(self.ignore_list.item(i).text() for i in range(self.ignore_list.count())),
+        )
+
+    def __on_preview_progress(self, generation, done, total):
+        if generation != self.__preview_generation:
+            return
+        self.preview_progress.setRange(0, total)
+        self.preview_progress.setValue(done)
+
+    def __on_preview_collected(self, generation, files):
+        if generation != self.__preview_generation:
+            return
+        if files == self.__preview_all_files:
+            # 只改了规则或选项时文件列表不变，目录保持原样（包括滚动位置）
+            return
+        self.__preview_all_files = files
+        self.preview_toc.clear()
         for _file in files:
-            with open(_file, "r", encoding="utf-8") as f:
-                f_read = f.read()
-
-                # 去除文档开头的元数据
-                f_read_split = f_read.split("---")
-                if len(f_read_split) > 1 and f_read.startswith("---"):
-                    f_read = f_read_split[2]
-
-                # 仅包含标题
-                include_list = []
-                if self.only_include_list.count() > 0:
-                    for i in range(self.only_include_list.count()):
-                        target_header = self.only_include_list.item(i).text()
-                        section = extract_section(f_read, target_header)
-                        if section:
-                            include_list.append(section)
-                if include_list:
-                    f_read = "\n\n".join(include_list)
-
-                # 不包含标题
-                exclude_list = []
-                if self._only_exclude_list.count() > 0:
-                    for i in range(self._only_exclude_list.count()):
-                        target_header = self._only_exclude_list.item(i).text()
-                        section = extract_section(f_read, target_header)
-                        if section:
-                            exclude_list.append(section)
-                if exclude_list:
-                    for section in exclude_list:
-                        f_read = f_read.replace(section, "")
-
-                # 替换 ![[inline]] 链接
-                inline_link_pattern = r"!\[\[(.+?)\]\]"  # 匹配 ![[link]] 的正则
-                inline_link_list = re.findall(inline_link_pattern, f_read)  # 获取所有匹配项
-                inline_link_map = {}
-                for inline_link in inline_link_list:
-                    f_name, section_name = inline_link.split("#") if "#" in inline_link else (inline_link, "")
-                    f_name = f_name + ".md" if not f_name.endswith(".md") else f_name
-                    # 查找名称匹配的文件
-                    _root_path = self._file_tree_model.rootPath()
-                    j_it = QDirIterator(_root_path, QDirIterator.IteratorFlag.Subdirectories)
-                    while j_it.hasNext():
-                        _j_file = j_it.next()
-                        if QFileInfo(_j_file).isFile() and QFileInfo(_j_file).fileName() == f_name:
-                            with open(_j_file, "r", encoding="utf-8") as j:
-                                if section_name:
-                                    inline_link_section = extract_section(j.read(), section_name)
-                                    if inline_link_section:
-                                        inline_link_map[inline_link] = inline_link_section
-                                else:
-                                    inline_link_map[inline_link] = j.read()
-                                break
-
-                for inline_link, inline_content in inline_link_map.items():
-                    f_read = f_read.replace(f"![[{inline_link}]]", inline_content)
-
-                # 替换 [[link]] 链接
-                pattern = r"\[\[([^\[\]|]+)\|?([^\[\]]*)\]\]"
-                f_read = re.sub(pattern, lambda m: m.group(2) if m.group(2) else m.group(1), f_read)
-
-                # 隐藏标题
-                if self.hide_header_list.count() > 0:
-                    for i in range(self.hide_header_list.count()):
-                        target_header = self.hide_header_list.item(i).text()
-                        f_read = replace_section_title(f_read, target_header, "")
-
-                content += "# " + QFileInfo(_file).fileName().rstrip(
-                    ".md") + "\n\n" if not self.hide_file_header.isChecked() else ""
-                content += f_read + "\n\n"
-                content += "---\n\n" if not self.hide_separator.isChecked() else ""
-
-        # content += "---" if not self.hide_separator.isChecked() else ""
-        self.preview.setMarkdown(content)
-
-
-def replace_section_title(markdown_text, old_title, new_title):
-    # 匹配标题的正则，忽略标题的级别（任意数量的 #）
-    header_level = old_title.count("#")  # 获取目标标题的级别
-    if header_level != 0:
-        pattern = rf"(^{re.escape(old_title)}\s*\n)"
-        # rf"(^#+\s*{re.escape(old_title)})(\s*\n)"
-    else:
-        pattern = rf"(^#+\s*{re.escape(old_title)}\s*\n)"
-    # 替换标题，不影响内容
-    replacement = rf"{new_title}"  # 替换为新标题（可调整级别）
-    # 使用 re.MULTILINE 保证 ^ 匹配行首
-    updated_text = re.sub(pattern, replacement, markdown_text, flags=re.MULTILINE)
-    return updated_text
-
-
-def extract_section(markdown_text, target_header):
-    # 构建目标标题的正则模式，包括内容及子标题
-    # 捕获从目标标题开始到下一个同级或更高级标题为止的所有内容
-    header_level = target_header.count("#")  # 获取目标标题的级别
-    if header_level != 0:
-        pattern = rf"(^{re.escape(target_header)}\s*\n)(.*?)(?=^#{{1,{header_level}}} |\Z)"
-    else:
-        pattern = rf"(^#+\s*{re.escape(target_header)}\s*\n)(.*?)(?=^#|\Z)"
-    # 使用 re.DOTALL 使 `.*?` 跨行匹配，并使用 re.MULTILINE 处理多行
-    match = re.search(pattern, markdown_text, re.MULTILINE | re.DOTALL)
-
-    if match:
-        return match.group(0)  # 返回匹配到的内容
-    else:
-        return None
-
-
-# Markdown 转 Word
-def convert_markdown_to_word(markdown_content, output_path):
-    if pypandoc.get_pandoc_path() is None:
-        pypandoc.download_pandoc()
-    markdown_content = markdown_content.replace("- - -", "")
-    pypandoc.convert_text(markdown_content, "docx", format="md", outputfile=output_path)
-    return True
-
-
-# 保存 Markdown 文件
-def save_markdown_file(markdown_content, output_path):
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(markdown_content)
-    return True
+            _item = QListWidgetItem(file_title(_file))
+            _item.setToolTip(_file)
+            self.preview_toc.addItem(_item)
+
+    def __on_preview_finished(self, generation, start, fragments, files, mode, profile):
+        if generation != self.__preview_generation:
+            return
+        self.preview_progress.hide()
+        _files = [os.path.normpath(_file) for _file in files]
+        _scroll_bar = self.preview.verticalScrollBar()
+        _patched = len(_files)
+        # 预览文档的排版（插入、替换文本块）在界面线程中进行，单独计时
+        with profile.stage("layout", files=len(_files)):
+            if mode == PREVIEW_RESET:
+                # 只改动新增、删除和内容变化的文件块，其余块与滚动位置保持不变
+                _patched = self.preview_document.patch(list(zip(_files, fragments)))
+                self.__preview_start = start
+                if self.__preview_jump_to in _files:
+                    self.preview_document.scroll_to(self.__preview_jump_to)
+                self.__preview_jump_to = None
+            elif mode == PREVIEW_APPEND:
+                for _file, _fragment in zip(_files, fragments):
+                    self.preview_document.insert_block(len(self.preview_document), _file, _fragment)
+                # 文档过长时丢弃最前面的文件，并保持视口内容不动
+                _dropped = len(self.preview_document) - PREVIEW_MAX_LOADED_FILES
+                if _dropped > 0:
+                    _anchor = self.preview_document.keys()[_dropped]
+                    _top = self.preview_document.block_top(_anchor)
+                    for _key in self.preview_document.keys()[:_dropped]:
+                        self.preview_document.remove_block(_key)
+                    _scroll_bar.setValue(_scroll_bar.value() - int(_top - self.preview_document.block_top(_anchor)))
+                    self.__preview_start += _dropped
+            else:
+                _anchor = self.preview_document.keys()[0] if len(self.preview_document) else None
+                _top = self.preview_document.block_top(_anchor) if _anchor is not None else 0
+                for _index, (_file, _fragment) in enumerate(zip(_files, fragments)):
+                    self.preview_document.insert_block(_index, _file, _fragment)
+                if _anchor is not None:
+                    _scroll_bar.setValue(_scroll_bar.value() + int(self.preview_document.block_top(_anchor) - _top))
+                self.__preview_start = start
+                for _key in self.preview_document.keys()[PREVIEW_MAX_LOADED_FILES:]:
+                    self.preview_document.remove_block(_key)
+
+        self.__preview_files = set(self.preview_document.keys())
+        _watched = set(self.__preview_files)
+        for _file in self.__preview_files:
+            _watched |= self._fragment_cache.dependencies(_file)
+        self._vault_watcher.watch_files(_watched)
+        _stats = self._fragment_cache.stats()
+        self.statusBar().showMessage(
+            f"预览第 {self.__preview_start + 1}–{self.__preview_start + len(self.preview_document)} 个文件，"
+            f"共 {len(self.__preview_all_files)} 个，更新 {_patched} 个；"
+            f"缓存命中 {_stats['hits']} / 未命中 {_stats['misses']}，"
+            f"{_stats['entries']} 个片段，{_stats['size_bytes'] / 1024 / 1024:.1f}/{_stats['max_bytes'] / 1024 / 1024:.0f} MB")
+        self.__on_run_profiled(profile)
+        # 插入过程中滚动条的变化不触发加载，处理完才释放任务
+        self.__preview_task = None
+        if mode != PREVIEW_PREPEND:
+            # 内容还填不满视口时继续加载
+            self.__on_preview_scrolled(_scroll_bar.value())
+
+    def __load_preview_page(self, start, count, mode):
+        _paths = [self._file_tree_model.filePath(_item) for _item in self.__selected_selected_files]
+        self.__preview_task = PreviewRenderTask(self.__preview_generation, _paths, self.__current_rules(),
+                                                self._vault_index, self._fragment_cache,
+                                                self.__current_selection_filter(),
+                                                files=self.__preview_all_files, start=start, count=count,
+                                                profile=self.__new_profile("预览"))
+        self.__connect_preview_task(self.__preview_task, mode)
+        QThreadPool.globalInstance().start(self.__preview_task)
+
+    def __connect_preview_task(self, task, mode):
+        task.signals.progress.connect(self.__on_preview_progress)
+        task.signals.collected.connect(self.__on_preview_collected)
+        task.signals.finished.connect(lambda generation, start, fragments, files:
+                                      self.__on_preview_finished(generation, start, fragments, files, mode,
+                                                                 task.profile))
+        task.signals.failed.connect(self.__on_preview_failed)
+        self.preview_progress.setRange(0, 0)
+        self.preview_progress.show()
+
+    def __on_preview_scrolled(self, value):
+        # 接近底部时加载后面的文件，回到顶部时加载前面的文件
+        if self.__preview_task is not None or not len(self.preview_document):
+            return
+        _scroll_bar = self.preview.verticalScrollBar()
+        _end = self.__preview_start + len(self.preview_document)
+        if value >= _scroll_bar.maximum() - _scroll_bar.pageStep() and _end < len(self.__preview_all_files):
+            self.__load_preview_page(_end, PREVIEW_PAGE_FILES, PREVIEW_APPEND)
+        elif value <= _scroll_bar.minimum() and self.__preview_start > 0:
+            _start = max(0, self.__preview_start - PREVIEW_PAGE_FILES)
+            self.__load_preview_page(_start, self.__preview_start - _start, PREVIEW_PREPEND)
+
+    def __on_preview_toc_clicked(self, item):
+        _file = os.path.normpath(self.__preview_all_files[self.preview_toc.row(item)])
+        if _file in self.__preview_files:
+            self.preview_document.scroll_to(_file)
+            return
+        # 跳转到未加载的文件：从该文件开始重新渲染一页
+        if self.__preview_task is not None:
+            self.__preview_task.cancel()
+        self.__preview_jump_to = _file
+        self.__load_preview_page(self.preview_toc.row(item), PREVIEW_PAGE_FILES, PREVIEW_RESET)
+
+    def __new_profile(self, name):
+        return RunProfile(name, self.profile_mode.currentData())
+
+    def __on_run_profiled(self, profile):
+        # 结束计时，开启跟踪时写出文件，并在状态栏显示摘要
+        try:
+            profile.finish(PROFILE_OUTPUT_DIR)
+        except OSError as e:
+            self.statusBar().showMessage(f"性能记录保存失败：{e}", 5000)
+        self.__last_profile = profile
+        self.profile_summary.setText(profile.summary(limit=3))
+        self.profile_summary.setToolTip("\n".join(profile.output_paths))
+
+    def __show_profile_details(self):
+        if self.__last_profile is None:
+            QMessageBox.information(self, "性能详情", "还没有完成的预览或导出。")
+            return
+        ProfileDialog(self.__last_profile, self).exec()
+
+    def __on_preview_failed(self, generation, message):
+        if generation != self.__preview_generation:
+            return
+        self.__preview_task = None
+        self.preview_progress.hide()
+        QMessageBox.warning(self, "预览", f"预览生成失败：{message}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,119 @@
+﻿from PySide6.QtGui import QTextCursor, QTextFrameFormat
+
+
+class PreviewDocument:
+    """
+    预览文档中按文件划分的块：每个文件的片段放在一个独立的 QTextFrame 中，
+    可以单独插入、替换、删除，而不必对整个文档调用 setMarkdown 重新排版。
+    patch() 将文档更新为新的块列表，只改动新增、删除和内容变化的块，并保持视口内容不动。
+    """
+
+    def __init__(self, text_browser):
+        self._browser = text_browser
+        self._browser.document().setUndoRedoEnabled(False)
+        self._keys = []
+        self._frames = []
+        self._fragments = []
+        self._frame_format = QTextFrameFormat()
+        self._frame_format.setBorder(0)
+        self._frame_format.setMargin(0)
+        self._frame_format.setPadding(0)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def keys(self):
+        return list(self._keys)
+
+    def clear(self):
+        self._browser.clear()
+        self._keys = []
+        self._frames = []
+        self._fragments = []
+
+    def patch(self, blocks):
+        """
+        将文档更新为 blocks（[(key, markdown)]）的顺序与内容，返回改动的块数。
+        """
+        _keys = {_key for _key, _ in blocks}
+        _anchor = self._first_visible(_keys)
+        _anchor_top = self.block_top(_anchor) if _anchor is not None else 0
+        _changed = 0
+        for _key in [_key for _key in self._keys if _key not in _keys]:
+            self.remove_block(_key)
+            _changed += 1
+        for _index, (_key, _markdown) in enumerate(blocks):
+            if _index < len(self._keys) and self._keys[_index] == _key:
+                if self._fragments[_index] != _markdown:
+                    self.replace_block(_key, _markdown)
+                    _changed += 1
+                continue
+            if _key in self._keys:
+                # 顺序变化：移到新位置
+                self.remove_block(_key)
+            self.insert_block(_index, _key, _markdown)
+            _changed += 1
+        if _anchor is not None and _changed:
+            _scroll_bar = self._browser.verticalScrollBar()
+            _scroll_bar.setValue(_scroll_bar.value() + int(self.block_top(_anchor) - _anchor_top))
+        return _changed
+
+    def insert_block(self, index, key, markdown):
+        _cursor = self._cursor_before(index)
+        _cursor.beginEditBlock()
+        _frame = _cursor.insertFrame(self._frame_format)
+        _cursor.insertMarkdown(markdown)
+        _cursor.endEditBlock()
+        self._keys.insert(index, key)
+        self._frames.insert(index, _frame)
+        self._fragments.insert(index, markdown)
+
+    def replace_block(self, key, markdown):
+        _index = self._keys.index(key)
+        _frame = self._frames[_index]
+        # 只替换框架内的内容，框架本身及其他块不动
+        _cursor = _frame.firstCursorPosition()
+        _cursor.beginEditBlock()
+        _cursor.setPosition(_frame.lastPosition(), QTextCursor.MoveMode.KeepAnchor)
+        _cursor.removeSelectedText()
+        _cursor.insertMarkdown(markdown)
+        _cursor.endEditBlock()
+        self._fragments[_index] = markdown
+
+    def remove_block(self, key):
+        _index = self._keys.index(key)
+        _frame = self._frames[_index]
+        # 连同框架的起止标记一起删除
+        _cursor = QTextCursor(self._browser.document())
+        _cursor.setPosition(_frame.firstPosition() - 1)
+        _cursor.setPosition(_frame.lastPosition() + 1, QTextCursor.MoveMode.KeepAnchor)
+        _cursor.removeSelectedText()
+        del self._keys[_index]
+        del self._frames[_index]
+        del self._fragments[_index]
+
+    def block_top(self, key):
+        """块在文档中的纵向位置（像素），用于跳转和在插入/删除前后保持滚动位置"""
+        _frame = self._frames[self._keys.index(key)]
+        return self._browser.document().documentLayout().frameBoundingRect(_frame).top()
+
+    def scroll_to(self, key):
+        self._browser.verticalScrollBar().setValue(int(self.block_top(key)))
+
+    def _first_visible(self, keys):
+        # 视口顶部所在的块（只考虑 keys 中会保留的块），用于更新后恢复滚动位置
+        _value = self._browser.verticalScrollBar().value()
+        _layout = self._browser.document().documentLayout()
+        for _key, _frame in zip(self._keys, self._frames):
+            if _key in keys and _layout.frameBoundingRect(_frame).bottom() > _value:
+                return _key
+        return None
+
+    def _cursor_before(self, index):
+        _cursor = QTextCursor(self._browser.document())
+        if index >= len(self._frames):
+            _cursor.movePosition(QTextCursor.MoveOperation.End)
+        else:
+            # 前一个块与该框架之间的空段落末尾
+            _cursor.setPosition(self._frames[index].firstPosition() - 1)
+        return _cursor
@@ -0,0 +1,74 @@
+﻿import threading
+
+from PySide6.QtCore import QObject, QRunnable, Signal
+
+from core.pipeline import collect_files, render_fragments
+from core.profiling import NULL_PROFILE
+
+
+class PreviewWorkerSignals(QObject):
+    # generation, done, total
+    progress = Signal(int, int, int)
+    # generation, all selected files
+    collected = Signal(int, list)
+    # generation, start index, fragments, rendered files
+    finished = Signal(int, int, list, list)
+    # generation, message
+    failed = Signal(int, str)
+
+
+class PreviewRenderTask(QRunnable):
+    """
+    在 QThreadPool 中渲染预览。每个任务带一个递增的 generation，
+    新任务提交时旧任务会被 cancel()，界面线程也只接受最新 generation 的结果。
+
+    预览只渲染选择中从 start 起的 count 个文件；未传入 files 时先展开选择并通过 collected 报告全部文件，
+    start 超出范围时从头开始。传入 profile（RunProfile）时记录各阶段耗时。
+    """
+
+    def __init__(self, generation, paths, rules, vault_index, cache=None, selection_filter=None, files=None,
+                 start=0, count=None, profile=NULL_PROFILE):
+        super().__init__()
+        self.generation = generation
+        self.signals = PreviewWorkerSignals()
+        self._paths = list(paths)
+        self._rules = rules
+        self._vault_index = vault_index
+        self._cache = cache
+        self._selection_filter = selection_filter
+        self._files = files
+        self._start = start
+        self._count = count
+        self.profile = profile
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def run(self):
+        try:
+            with self.profile.profiled():
+                files = self._files
+                if files is None:
+                    with self.profile.stage("collect"):
+                        files = collect_files(self._paths, self._vault_index, self._selection_filter)
+                    if self.is_cancelled():
+                        return
+                    self.signals.collected.emit(self.generation, files)
+                _start = self._start if self._start < len(files) else 0
+                _page = files[_start:_start + self._count] if self._count is not None else files[_start:]
+                self.signals.progress.emit(self.generation, 0, len(_page))
+                fragments = render_fragments(_page, self._rules, self._vault_index,
+                                             is_cancelled=self.is_cancelled, cache=self._cache,
+                                             on_progress=lambda done, total:
+                                             self.signals.progress.emit(self.generation, done, total),
+                                             profile=self.profile)
+        except Exception as e:
+            if not self.is_cancelled():
+                self.signals.failed.emit(self.generation, str(e))
+            return
+        if fragments is not None and not self.is_cancelled():
+            self.signals.finished.emit(self.generation, _start, fragments, _page)
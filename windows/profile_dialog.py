@@ -0,0 +1,47 @@
+﻿from PySide6.QtCore import Qt
+from PySide6.QtWidgets import QDialog, QVBoxLayout, QLabel, QTableWidget, QTableWidgetItem, QDialogButtonBox, \
+    QHeaderView
+
+from core.profiling import COUNTER_LABELS
+
+
+class ProfileDialog(QDialog):
+    """
+    显示最近一次预览刷新或导出的分阶段耗时、处理的文件数与字节数，以及写出的跟踪文件
+    """
+
+    def __init__(self, profile, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("性能详情")
+        self.resize(560, 420)
+        _layout = QVBoxLayout()
+        self.setLayout(_layout)
+
+        _summary = QLabel(profile.summary())
+        _summary.setWordWrap(True)
+        _layout.addWidget(_summary)
+
+        _table = QTableWidget(0, 5)
+        _table.setHorizontalHeaderLabels(["阶段", "耗时 (ms)", "次数", "文件数", "大小 (KB)"])
+        _table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        _table.verticalHeader().setVisible(False)
+        _table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        for _label, _seconds, _calls, _files, _bytes in profile.rows():
+            _row = _table.rowCount()
+            _table.insertRow(_row)
+            for _column, _value in enumerate((_label, f"{_seconds * 1000:.1f}", str(_calls), str(_files),
+                                              f"{_bytes / 1024:.1f}")):
+                _table.setItem(_row, _column, QTableWidgetItem(_value))
+        _layout.addWidget(_table)
+
+        _counters = [f"{COUNTER_LABELS.get(_name, _name)}：{_value}" for _name, _value in profile.counters.items()]
+        if _counters:
+            _layout.addWidget(QLabel("，".join(_counters)))
+        for _path in profile.output_paths:
+            _output = QLabel(f"已保存：{_path}")
+            _output.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+            _layout.addWidget(_output)
+
+        _buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
+        _buttons.rejected.connect(self.reject)
+        _layout.addWidget(_buttons)
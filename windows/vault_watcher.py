@@ -0,0 +1,67 @@
+﻿import os
+
+from PySide6.QtCore import QObject, QFileSystemWatcher, QTimer, Signal
+
+# 编辑器保存时常常连续触发多次变化，合并这段时间内的通知
+WATCHER_DEBOUNCE_MS = 150
+
+
+class VaultWatcher(QObject):
+    """
+    监视仓库目录（增删文件）与预览涉及的文件（内容修改），将一段时间内的变化合并后通过 changed 发出。
+    """
+    # 变化的目录, 变化的文件
+    changed = Signal(list, list)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self.__on_directory_changed)
+        self._watcher.fileChanged.connect(self.__on_file_changed)
+        self._pending_dirs = set()
+        self._pending_files = set()
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(WATCHER_DEBOUNCE_MS)
+        self._timer.timeout.connect(self.__flush)
+
+    def clear(self):
+        self._set_watched(self._watcher.directories(), [])
+        self._set_watched(self._watcher.files(), [])
+        self._pending_dirs.clear()
+        self._pending_files.clear()
+
+    def watch_directories(self, dirs):
+        self._set_watched(self._watcher.directories(), dirs)
+
+    def watch_files(self, files):
+        self._set_watched(self._watcher.files(), files)
+
+    def _set_watched(self, current, wanted):
+        _current = {os.path.normpath(_path): _path for _path in current}
+        _wanted = {os.path.normpath(_path) for _path in wanted}
+        _removed = [_current[_path] for _path in _current.keys() - _wanted]
+        _added = [_path for _path in _wanted - _current.keys() if os.path.exists(_path)]
+        if _removed:
+            self._watcher.removePaths(_removed)
+        if _added:
+            self._watcher.addPaths(_added)
+
+    def __on_directory_changed(self, path):
+        self._pending_dirs.add(os.path.normpath(path))
+        self._timer.start()
+
+    def __on_file_changed(self, path):
+        self._pending_files.add(os.path.normpath(path))
+        # 原子保存会用新文件替换旧文件，监视随之失效，需要重新加入
+        if os.path.exists(path) and path not in self._watcher.files():
+            self._watcher.addPath(path)
+        self._timer.start()
+
+    def __flush(self):
+        _dirs = sorted(self._pending_dirs)
+        _files = sorted(self._pending_files)
+        self._pending_dirs.clear()
+        self._pending_files.clear()
+        if _dirs or _files:
+            self.changed.emit(_dirs, _files)
@@ -0,0 +1,36 @@
+﻿import threading
+
+from PySide6.QtCore import QObject, QRunnable, Signal
+
+
+class VaultSyncSignals(QObject):
+    # changed files, removed files
+    finished = Signal(list, list)
+    # message
+    failed = Signal(str)
+
+
+class VaultSyncTask(QRunnable):
+    """
+    在后台按 mtime/大小增量同步持久化的仓库索引。
+    """
+
+    def __init__(self, vault_database):
+        super().__init__()
+        self.signals = VaultSyncSignals()
+        self._vault_database = vault_database
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def run(self):
+        try:
+            changed, removed = self._vault_database.sync(is_cancelled=self._cancel_event.is_set)
+        except Exception as e:
+            # 切换仓库或退出时数据库在同步途中被关闭，已取消的任务不再报告
+            if not self._cancel_event.is_set():
+                self.signals.failed.emit(str(e))
+            return
+        if not self._cancel_event.is_set():
+            self.signals.finished.emit(changed, removed)